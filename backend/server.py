@@ -1,7 +1,16 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse, ORJSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING, ReturnDocument, monitoring
+from pymongo.errors import OperationFailure, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId, InvalidDocument
 import os
 import logging
 from pathlib import Path
@@ -9,21 +18,237 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-import random
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import silhouette_score
 import pandas as pd
-import io
+import json
+import time
+import asyncio
+import bisect
+import zlib
+import orjson
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow uploads are unavailable without pyarrow
+    pyarrow = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Responses fall back to gzip only
+    BrotliMiddleware = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(names, values) -> str:
+    """Render a Prometheus label set, escaping values"""
+    if not names:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Histogram:
+    """Thread-safe latency histogram per label set, rendered in Prometheus text format"""
+    def __init__(self, name: str, help_text: str, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series: Dict[tuple, list] = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, seconds: float, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+    
+    def render(self) -> List[str]:
+        with self.lock:
+            snapshot = {labels: (list(counts), total) for labels, (counts, total) in self.series.items()}
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bucket_names = self.label_names + ("le",)
+        for labels, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{format_labels(bucket_names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+class Counter:
+    """Thread-safe counter per label set, rendered in Prometheus text format"""
+    def __init__(self, name: str, help_text: str, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        with self.lock:
+            snapshot = dict(self.values)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{format_labels(self.label_names, labels)} {value:g}" for labels, value in sorted(snapshot.items())]
+        return lines
+
+http_request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"])
+mongo_command_seconds = Histogram("mongodb_command_duration_seconds", "MongoDB command latency by collection", ["command", "collection"])
+mongo_command_failures = Counter("mongodb_command_failures_total", "Failed MongoDB commands by collection", ["command", "collection"])
+span_seconds = Histogram("span_duration_seconds", "Duration of named processing stages", ["span"])
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Record every driver command's duration against its target collection"""
+    def __init__(self):
+        self.pending: Dict[tuple, str] = {}
+    
+    def started(self, event):
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        self.pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else "-"
+    
+    def succeeded(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), "-")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name, collection)
+    
+    def failed(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), "-")
+        mongo_command_seconds.observe(event.duration_micros / 1e6, event.command_name, collection)
+        mongo_command_failures.inc(event.command_name, collection)
+
+@contextmanager
+def timing_span(name: str):
+    """Record the wall time of a named stage, e.g. segmentation.fit"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_seconds.observe(time.perf_counter() - started, name)
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Batch analytics (segmentation and stats scans) read through a client with its
+# own pool, so a long job cannot hold every connection the UI lookups need. A
+# secondary read preference also moves that load off the primary; scans fall
+# back to the primary client while the replica lags (see analytics_source).
+analytics_mongo_url = os.environ.get('ANALYTICS_MONGO_URL', mongo_url)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))  # 0 = no timeout
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0'))  # 0 = wait for a free connection
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')  # e.g. "zstd,zlib"
+ANALYTICS_MAX_POOL_SIZE = int(os.environ.get('ANALYTICS_MAX_POOL_SIZE', '10'))
+ANALYTICS_READ_PREFERENCE = os.environ.get('ANALYTICS_READ_PREFERENCE', 'primary')
+
+# Opened by the app lifespan; a benchmark or test may set db/analytics_db beforehand
+client: Optional[AsyncIOMotorClient] = None
+db = None
+analytics_client: Optional[AsyncIOMotorClient] = None
+analytics_db = None
+
+def create_mongo_client(url: str, max_pool_size: int, **options) -> AsyncIOMotorClient:
+    """Motor client with the pool, timeout and compression settings from the environment"""
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min(MONGO_MIN_POOL_SIZE, max_pool_size),
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        compressors=[name for name in MONGO_COMPRESSORS.split(',') if name],
+        event_listeners=[MongoCommandMetrics()],
+        **options
+    )
+
+def open_mongo_clients():
+    """Connect the interactive and analytics databases that are not already set"""
+    global client, db, analytics_client, analytics_db
+    if db is None:
+        client = create_mongo_client(mongo_url, MONGO_MAX_POOL_SIZE, appname="corporate-card-api")
+        db = client[os.environ['DB_NAME']]
+    if analytics_db is None:
+        analytics_client = create_mongo_client(
+            analytics_mongo_url, ANALYTICS_MAX_POOL_SIZE,
+            appname="corporate-card-analytics", readPreference=ANALYTICS_READ_PREFERENCE
+        )
+        analytics_db = analytics_client[os.environ['DB_NAME']]
+
+def close_mongo_clients():
+    """Close the clients opened by open_mongo_clients, leaving databases set from outside alone"""
+    global client, db, analytics_client, analytics_db
+    if client is not None:
+        client.close()
+        client = db = None
+    if analytics_client is not None:
+        analytics_client.close()
+        analytics_client = analytics_db = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global process_pool
+    open_mongo_clients()
+    response_cache.backend = MongoCacheBackend(db.response_cache) if RESPONSE_CACHE_BACKEND == "mongo" else None
+    await ensure_indexes()
+    await ensure_dashboard_summary()
+    yield
+    close_mongo_clients()
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        process_pool = None
+
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', '1000'))
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', '50000'))
+ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', '2'))
+MAX_FINISHED_JOBS = 100
+SEGMENTATION_CHUNK_SIZE = int(os.environ.get('SEGMENTATION_CHUNK_SIZE', '50000'))
+MINIBATCH_THRESHOLD = int(os.environ.get('MINIBATCH_THRESHOLD', '100000'))
+MINIBATCH_SIZE = int(os.environ.get('MINIBATCH_SIZE', '4096'))
+AUTO_K_MIN = 2
+AUTO_K_MAX = int(os.environ.get('AUTO_K_MAX', '10'))
+AUTO_K_SAMPLE_SIZE = int(os.environ.get('AUTO_K_SAMPLE_SIZE', '20000'))
+SILHOUETTE_SAMPLE_SIZE = 5000
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_LIST_LIMIT = 1000
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 1000
+RECOMMENDATION_BATCH_SIZE = 10000
+MAX_SEED_CUSTOMERS = 1000000
+SEED_BLOCK_TRANSACTIONS = 200000
+SEED_INSERT_CONCURRENCY = int(os.environ.get('SEED_INSERT_CONCURRENCY', '4'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '300'))
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_MAX_ITEMS = int(os.environ.get('RESPONSE_CACHE_MAX_ITEMS', '10000'))
+FEATURE_SNAPSHOT_DIR = os.environ.get('FEATURE_SNAPSHOT_DIR', str(ROOT_DIR / 'feature_snapshots'))
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
 
-app = FastAPI()
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class APIResponse(ORJSONResponse):
+    """orjson rendering that also accepts numpy values and datetime subclasses such as pandas Timestamps"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=ORJSON_OPTIONS)
+
+app = FastAPI(default_response_class=APIResponse, lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 class Transaction(BaseModel):
@@ -66,6 +291,13 @@ class DashboardStats(BaseModel):
     total_transactions: int
     segment_distribution: List[Dict[str, Any]]
 
+class SegmentAssignRequest(BaseModel):
+    customer_ids: Optional[List[str]] = None
+
+class RecommendationBatchRequest(BaseModel):
+    customer_ids: Optional[List[str]] = None
+    segment: Optional[str] = None
+
 class ProductRecommendation(BaseModel):
     product_name: str
     reason: str
@@ -76,64 +308,568 @@ class ProductRecommendation(BaseModel):
 async def root():
     return {"message": "Corporate Card Analytics API"}
 
-async def run_segmentation():
-    """Run K-Means clustering on customer data"""
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
+process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Lazily create the worker pool used for CPU-bound analytics"""
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(max_workers=ANALYTICS_WORKERS)
+    return process_pool
+
+async def run_in_process(func, *args):
+    """Run a CPU-bound function in the worker pool without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), func, *args)
+
+class ResponseCache:
+    """In-process LRU cache with a TTL, optionally layered over a shared backend
     
-    if len(customers) < 4:
-        raise HTTPException(status_code=400, detail="Not enough customers for segmentation")
+    Keys embed a data version, so entries for superseded data are never read
+    again and simply age out of the LRU. Lists longer than max_items (e.g. a
+    long daily spend series) are not cached at all, and a failing backend
+    only costs the shared layer.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float, backend=None, max_items: int = RESPONSE_CACHE_MAX_ITEMS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.max_items = max_items
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+        self.backend_errors = 0
     
-    df = pd.DataFrame(customers)
+    async def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        if self.backend is not None:
+            try:
+                value = await self.backend.get(key)
+            except PyMongoError as e:
+                self.backend_errors += 1
+                logger.warning("Response cache backend read failed: %s", e)
+                value = None
+            if value is not None:
+                self.shared_hits += 1
+                self.store(key, value)
+                return value
+        self.misses += 1
+        return None
     
-    # Initialize columns with proper data types
-    df['total_transactions'] = 0
-    df['avg_transaction_value'] = 0.0
-    df['top_merchant_category'] = ""
+    async def set(self, key: str, value):
+        if isinstance(value, list) and len(value) > self.max_items:
+            self.oversized += 1
+            return
+        self.store(key, value)
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, self.ttl_seconds)
+            except (PyMongoError, InvalidDocument) as e:
+                self.backend_errors += 1
+                logger.warning("Response cache backend write failed for %s: %s", key.split('|', 1)[0], e)
     
-    for idx, customer_id in enumerate(df['id']):
-        transactions = await db.transactions.find(
-            {"customer_id": customer_id},
-            {"_id": 0}
-        ).to_list(1000)
-        
-        if transactions:
-            df.at[idx, 'total_transactions'] = int(len(transactions))
-            
-            avg_value = sum(t['amount'] for t in transactions) / len(transactions)
-            df.at[idx, 'avg_transaction_value'] = float(avg_value)
-            
-            category_counts = {}
-            for t in transactions:
-                cat = t['merchant_category']
-                category_counts[cat] = category_counts.get(cat, 0) + 1
-            df.at[idx, 'top_merchant_category'] = max(category_counts, key=category_counts.get) if category_counts else ""
+    def store(self, key: str, value):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
     
-    features = ['monthly_spend', 'spend_volatility', 'international_ratio', 'payment_timeliness_score']
-    X = df[features].values
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "oversized": self.oversized,
+            "backend_errors": self.backend_errors,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None
+        }
+
+class MongoCacheBackend:
+    """Shared response cache stored in a Mongo collection with a TTL index"""
+    def __init__(self, collection):
+        self.collection = collection
     
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    async def get(self, key: str):
+        entry = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return entry["value"] if entry else None
+    
+    async def set(self, key: str, value, ttl_seconds: float):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        await self.collection.replace_one({"_id": key}, {"value": value, "expires_at": expires_at}, upsert=True)
+
+# The Mongo backend is attached once the lifespan has connected
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+jobs: Dict[str, Dict[str, Any]] = {}
+active_jobs: Dict[str, str] = {}
+job_tasks = set()
+
+def submit_job(kind: str, func, key: Optional[str] = None) -> Dict[str, Any]:
+    """Start a background job, or return the identical one already in flight
     
-    n_clusters = min(4, len(customers))  # Ensure we don't create more clusters than customers
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    df['segment_id'] = kmeans.fit_predict(X_scaled)
+    Jobs are deduplicated by key, which defaults to the kind; jobs whose
+    parameters change the outcome should include them in the key.
+    """
+    key = key or kind
+    if key in active_jobs:
+        return jobs[active_jobs[key]]
     
-    segment_names = {
-        0: "High-Growth Corporates",
-        1: "Travel-Heavy Corporates",
-        2: "Low-Engagement / At-Risk",
-        3: "Stable Mature Accounts"
+    job = {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "status": "queued",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        "duration_ms": None,
+        "result": None,
+        "error": None
     }
+    jobs[job["id"]] = job
+    active_jobs[key] = job["id"]
+    
+    finished = [j for j in jobs.values() if j["status"] in ("completed", "failed")]
+    for old in sorted(finished, key=lambda j: j["created_at"])[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        jobs.pop(old["id"], None)
+    
+    task = asyncio.create_task(execute_job(job, func, key))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+    return job
+
+async def execute_job(job: Dict[str, Any], func, key: str):
+    started = time.perf_counter()
+    job["status"] = "running"
+    job["started_at"] = datetime.now(timezone.utc).isoformat()
+    try:
+        job["result"] = await func()
+        job["status"] = "completed"
+    except HTTPException as e:
+        job["status"] = "failed"
+        job["error"] = e.detail
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        job["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        active_jobs.pop(key, None)
+
+async def bulk_write_batches(collection, operations: List[Any], batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Send write operations as chunked, unordered bulk_write batches"""
+    batch_size = batch_size or WRITE_BATCH_SIZE
+    started = time.perf_counter()
+    batches = 0
+    matched = 0
+    for start in range(0, len(operations), batch_size):
+        result = await collection.bulk_write(operations[start:start + batch_size], ordered=False)
+        batches += 1
+        matched += result.matched_count
+    return {
+        "matched_count": matched,
+        "write_batches": batches,
+        "write_latency_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+STAGING_SUFFIX = "_staging"
+
+async def create_staging(name: str):
+    """Start an empty staging copy of a collection carrying the target's declared indexes"""
+    staging = db[name + STAGING_SUFFIX]
+    await staging.drop()
+    await staging.create_indexes(INDEXES[name])
+    return staging
+
+async def swap_in_staging(name: str):
+    """Replace a collection with its staging copy in one atomic rename"""
+    await db[name + STAGING_SUFFIX].rename(name, dropTarget=True)
+
+DASHBOARD_SUMMARY_ID = "dashboard"
+DASHBOARD_SUMMARY_FIELDS = ("total_customers", "total_spend", "total_transactions", "segment_counts")
+
+async def update_dashboard_summary(set_fields: Optional[Dict[str, Any]] = None, inc_fields: Optional[Dict[str, Any]] = None):
+    """Apply an incremental change to the materialized dashboard summary
+    
+    Every write path ends with this call, so it also bumps data_version, which
+    keys the response cache.
+    """
+    update = {
+        "$set": {**(set_fields or {}), "updated_at": datetime.now(timezone.utc).isoformat()},
+        "$inc": {**(inc_fields or {}), "data_version": 1}
+    }
+    await db.summaries.update_one({"_id": DASHBOARD_SUMMARY_ID}, update, upsert=True)
+
+async def count_segments() -> Dict[str, int]:
+    """Count customers per segment with one aggregation"""
+    segment_counts = {}
+    async for doc in db.customers.aggregate([{"$group": {"_id": "$segment", "count": {"$sum": 1}}}]):
+        segment_counts[doc['_id'] or "Unassigned"] = segment_counts.get(doc['_id'] or "Unassigned", 0) + doc['count']
+    return segment_counts
+
+async def refresh_dashboard_summary(inc_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Rebuild the dashboard summary from the collections"""
+    totals = await db.customers.aggregate([
+        {"$group": {"_id": None, "count": {"$sum": 1}, "spend": {"$sum": "$monthly_spend"}}}
+    ]).to_list(1)
+    summary = {
+        "total_customers": totals[0]['count'] if totals else 0,
+        "total_spend": float(totals[0]['spend']) if totals else 0.0,
+        "total_transactions": await db.transactions.count_documents({}),
+        "segment_counts": await count_segments()
+    }
+    await update_dashboard_summary(summary, inc_fields)
+    return summary
+
+async def ensure_dashboard_summary() -> Dict[str, Any]:
+    """Return the dashboard summary, rebuilding it if any of its totals are missing
+    
+    Version bumps and tokens can upsert the document before the totals exist,
+    e.g. on a database populated before the summary was introduced.
+    """
+    summary = await db.summaries.find_one({"_id": DASHBOARD_SUMMARY_ID})
+    if summary is None or any(field not in summary for field in DASHBOARD_SUMMARY_FIELDS):
+        summary = await refresh_dashboard_summary()
+    return summary
+
+async def analytics_source():
+    """Database for a batch scan: the analytics client once it has caught up, otherwise the primary one
+    
+    Every write path bumps data_version after its writes and replication
+    applies them in order, so a replica whose summary has reached the
+    primary's data_version holds everything written before it. Reads that
+    follow writes not yet followed by a bump must use db directly.
+    """
+    if ANALYTICS_READ_PREFERENCE == "primary" and analytics_mongo_url == mongo_url:
+        return analytics_db
+    primary = await db.summaries.find_one({"_id": DASHBOARD_SUMMARY_ID}, {"data_version": 1})
+    replica = await analytics_db.summaries.find_one({"_id": DASHBOARD_SUMMARY_ID}, {"data_version": 1})
+    if (replica or {}).get('data_version', 0) >= (primary or {}).get('data_version', 0):
+        return analytics_db
+    return db
+
+async def get_data_versions() -> Dict[str, Any]:
+    """Read the counters bumped by write paths (data_version) and segment changes (segmentation_version)"""
+    summary = await db.summaries.find_one(
+        {"_id": DASHBOARD_SUMMARY_ID}, {"data_version": 1, "segmentation_version": 1, "updated_at": 1}
+    )
+    return {
+        "data_version": summary.get('data_version', 0) if summary else 0,
+        "segmentation_version": summary.get('segmentation_version', 0) if summary else 0,
+        "updated_at": summary.get('updated_at') if summary else None
+    }
+
+async def cached_response(endpoint: str, params: Dict[str, Any], compute, version_field: str = "data_version"):
+    """Serve a read endpoint from the response cache, computing it on a miss"""
+    version = (await get_data_versions())[version_field]
+    key = f"{endpoint}|{json.dumps(params, sort_keys=True, default=str)}|{version_field}={version}"
+    value = await response_cache.get(key)
+    if value is None:
+        value = await compute()
+        await response_cache.set(key, value)
+    return value
+
+TRANSACTION_FEATURE_COLUMNS = ['total_transactions', 'avg_transaction_value', 'top_merchant_category']
+TRANSACTION_COUNTER_COLUMNS = ['total_transaction_amount', 'merchant_category_counts']
+
+def add_transaction_totals(totals: Dict[str, Dict[str, Any]], customer_id: str, category: str, count: int, amount: float):
+    """Accumulate a (customer, category) count and amount into running totals"""
+    entry = totals.setdefault(customer_id, {"total_transaction_amount": 0.0, "merchant_category_counts": {}})
+    counts = entry["merchant_category_counts"]
+    counts[category] = counts.get(category, 0) + int(count)
+    entry["total_transaction_amount"] += float(amount)
+
+def summarize_transactions(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Reduce a frame of transactions to per-customer running totals"""
+    totals = {}
+    grouped = df.groupby(['customer_id', 'merchant_category'], sort=False)['amount'].agg(['size', 'sum'])
+    for (customer_id, category), count, amount in zip(grouped.index, grouped['size'].tolist(), grouped['sum'].tolist()):
+        add_transaction_totals(totals, customer_id, category, count, amount)
+    return totals
+
+def merge_transaction_totals(totals: Dict[str, Dict[str, Any]], delta: Dict[str, Dict[str, Any]]):
+    """Merge one set of running totals into another in place"""
+    for customer_id, entry in delta.items():
+        for category, count in entry["merchant_category_counts"].items():
+            add_transaction_totals(totals, customer_id, category, count, 0.0)
+        totals[customer_id]["total_transaction_amount"] += entry["total_transaction_amount"]
+
+async def aggregate_transaction_totals(customer_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Compute per-customer running totals in a single server-side aggregation"""
+    pipeline = []
+    if customer_ids is not None:
+        pipeline.append({"$match": {"customer_id": {"$in": list(customer_ids)}}})
+    pipeline.append({"$group": {
+        "_id": {"customer_id": "$customer_id", "merchant_category": "$merchant_category"},
+        "count": {"$sum": 1},
+        "amount": {"$sum": "$amount"}
+    }})
+    
+    totals = {}
+    async for doc in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        add_transaction_totals(totals, doc['_id']['customer_id'], doc['_id']['merchant_category'], doc['count'], doc['amount'])
+    return totals
+
+def transaction_features(totals: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    """Derive customer transaction features from running totals"""
+    rows = []
+    for customer_id, entry in totals.items():
+        counts = entry["merchant_category_counts"]
+        total_transactions = sum(counts.values())
+        top_category = min(counts, key=lambda cat: (-counts[cat], cat)) if counts else ""
+        avg_value = entry["total_transaction_amount"] / total_transactions if total_transactions else 0.0
+        rows.append((customer_id, total_transactions, avg_value, top_category, entry["total_transaction_amount"], counts))
+    stats = pd.DataFrame(rows, columns=['id'] + TRANSACTION_FEATURE_COLUMNS + TRANSACTION_COUNTER_COLUMNS)
+    return stats.astype({'total_transactions': int, 'avg_transaction_value': float, 'total_transaction_amount': float})
+
+def transaction_stats_update(total_transactions, avg_transaction_value, top_merchant_category,
+                             total_transaction_amount, merchant_category_counts) -> Dict[str, Any]:
+    """Build the $set document for a customer's transaction statistics"""
+    return {
+        "total_transactions": int(total_transactions),
+        "avg_transaction_value": float(avg_transaction_value),
+        "top_merchant_category": top_merchant_category,
+        "total_transaction_amount": float(total_transaction_amount),
+        "merchant_category_counts": merchant_category_counts
+    }
+
+ROLLUP_GRANULARITIES = ('day', 'month')
+ROLLUP_KEY_COLUMNS = ['granularity', 'customer_id', 'merchant_category', 'period']
+ROLLUP_VALUE_COLUMNS = ['amount', 'count', 'international_count']
+
+def build_rollups(frame: pd.DataFrame) -> pd.DataFrame:
+    """Sum amount, count and international count per customer, merchant category and day/month bucket
+    
+    frame needs customer_id, merchant_category, transaction_date, amount and
+    is_international; pre-aggregated rows carrying count and
+    international_count columns instead can be rolled up again.
+    """
+    if 'count' not in frame.columns:
+        frame = frame.assign(count=1, international_count=frame['is_international'].astype(int))
+    dates = pd.to_datetime(frame['transaction_date'], utc=True).dt.tz_localize(None)
+    periods = {"day": dates.dt.floor('D'), "month": dates.dt.to_period('M').dt.to_timestamp()}
+    parts = [
+        frame.assign(granularity=granularity, period=periods[granularity])
+        .groupby(ROLLUP_KEY_COLUMNS, sort=False)
+        .agg(amount=('amount', 'sum'), count=('count', 'sum'), international_count=('international_count', 'sum'))
+        .reset_index()
+        for granularity in ROLLUP_GRANULARITIES
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+def merge_rollups(rollups: List[pd.DataFrame]) -> pd.DataFrame:
+    """Combine rollups built from separate chunks into one row per bucket"""
+    if len(rollups) == 1:
+        return rollups[0]
+    return pd.concat(rollups, ignore_index=True).groupby(ROLLUP_KEY_COLUMNS, sort=False)[ROLLUP_VALUE_COLUMNS].sum().reset_index()
+
+def rollup_documents(rollups: pd.DataFrame) -> List[Dict[str, Any]]:
+    columns = ROLLUP_KEY_COLUMNS + ROLLUP_VALUE_COLUMNS
+    return [dict(zip(columns, row)) for row in zip(*(rollups[col].tolist() for col in columns))]
+
+def rollup_operations(rollups: pd.DataFrame) -> List[UpdateOne]:
+    """Build upserts that $inc rollup rows into their existing buckets"""
+    return [
+        UpdateOne(
+            {col: doc[col] for col in ROLLUP_KEY_COLUMNS},
+            {"$inc": {col: doc[col] for col in ROLLUP_VALUE_COLUMNS}},
+            upsert=True
+        )
+        for doc in rollup_documents(rollups)
+    ]
+
+async def insert_rollups(collection, rollups: pd.DataFrame):
+    """Insert rollup rows, converting them to documents a chunk at a time in the threadpool"""
+    for start in range(0, len(rollups), INGEST_CHUNK_SIZE):
+        documents = await run_in_threadpool(rollup_documents, rollups.iloc[start:start + INGEST_CHUNK_SIZE])
+        await insert_parallel(collection, documents)
+
+async def write_rollups(rollups: pd.DataFrame, reset: bool = False) -> Dict[str, Any]:
+    """Swap in a fresh set of rollups, or $inc them into existing buckets when appending"""
+    if reset:
+        await insert_rollups(await create_staging("transaction_rollups"), rollups)
+        await swap_in_staging("transaction_rollups")
+        return {"rollups_written": len(rollups)}
+    write_stats = {"matched_count": 0, "write_batches": 0, "write_latency_ms": 0.0}
+    for start in range(0, len(rollups), INGEST_CHUNK_SIZE):
+        operations = await run_in_threadpool(rollup_operations, rollups.iloc[start:start + INGEST_CHUNK_SIZE])
+        for field, value in (await bulk_write_batches(db.transaction_rollups, operations)).items():
+            write_stats[field] += value
+    write_stats["write_latency_ms"] = round(write_stats["write_latency_ms"], 2)
+    return {"rollups_written": len(rollups), **write_stats}
+
+async def rebuild_rollups() -> Dict[str, Any]:
+    """Recompute every rollup from raw transactions, grouped per day on the server
+    
+    The daily groups arrive sorted by customer and are rolled up a chunk of
+    INGEST_CHUNK_SIZE rows at a time, cut between customers so that every
+    month bucket is complete within its chunk.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "customer_id": "$customer_id",
+                "merchant_category": "$merchant_category",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$transaction_date"}}
+            },
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "international_count": {"$sum": {"$cond": ["$is_international", 1, 0]}}
+        }},
+        {"$sort": {"_id.customer_id": 1}}
+    ]
+    staging = await create_staging("transaction_rollups")
+    written = 0
+    
+    async def flush(rows):
+        daily = pd.DataFrame(rows, columns=['customer_id', 'merchant_category', 'transaction_date'] + ROLLUP_VALUE_COLUMNS)
+        rollups = await run_in_threadpool(build_rollups, daily)
+        await insert_rollups(staging, rollups)
+        return len(rollups)
+    
+    rows = []
+    async for doc in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        key = doc['_id']
+        if len(rows) >= INGEST_CHUNK_SIZE and key['customer_id'] != rows[-1][0]:
+            written += await flush(rows)
+            rows = []
+        rows.append((key['customer_id'], key['merchant_category'], key['day'], doc['amount'], doc['count'], doc['international_count']))
+    if rows:
+        written += await flush(rows)
+    await swap_in_staging("transaction_rollups")
+    return {"rollups_written": written}
+
+DERIVED_FEATURE_COLUMNS = ['monthly_spend', 'spend_volatility', 'international_ratio']
+
+def compute_derived_features(monthly: pd.DataFrame) -> pd.DataFrame:
+    """Derive behavior features per customer from monthly rollup rows
+    
+    Months between a customer's first and last active month count as zero
+    spend, so monthly_spend is the mean over that span and spend_volatility its
+    coefficient of variation (capped at 1); international_ratio is the share of
+    international transactions.
+    """
+    per_month = monthly.groupby(['customer_id', 'period'], sort=False)[ROLLUP_VALUE_COLUMNS].sum().reset_index()
+    per_month['month_index'] = per_month['period'].dt.year * 12 + per_month['period'].dt.month
+    per_month['amount_squared'] = per_month['amount'] ** 2
+    grouped = per_month.groupby('customer_id', sort=False).agg(
+        first_month=('month_index', 'min'),
+        last_month=('month_index', 'max'),
+        total=('amount', 'sum'),
+        total_squared=('amount_squared', 'sum'),
+        count=('count', 'sum'),
+        international_count=('international_count', 'sum')
+    )
+    months = (grouped['last_month'] - grouped['first_month'] + 1).to_numpy(dtype=float)
+    mean = grouped['total'].to_numpy(dtype=float) / months
+    std = np.sqrt(np.maximum(grouped['total_squared'].to_numpy(dtype=float) / months - mean ** 2, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volatility = np.where(mean > 0, np.minimum(std / mean, 1.0), 0.0)
+        international = np.where(grouped['count'] > 0, grouped['international_count'] / grouped['count'], 0.0)
+    return pd.DataFrame({
+        "id": grouped.index,
+        "monthly_spend": np.round(mean, 2),
+        "spend_volatility": volatility,
+        "international_ratio": international
+    })
+
+async def derive_customer_features(customer_ids: Optional[List[str]] = None, source=None) -> Dict[str, Any]:
+    """Recompute derived features from the monthly rollups, a chunk of customers at a time
+    
+    Without customer_ids every customer is recomputed; customers without any
+    transactions keep their uploaded values. Pass source=db when the rollups
+    were just written.
+    """
+    started = time.perf_counter()
+    source = source if source is not None else await analytics_source()
+    await invalidate_feature_snapshot()
+    
+    async def derive_chunk(chunk: List[str]) -> int:
+        rows = []
+        query = {"granularity": "month", "customer_id": {"$in": chunk}}
+        projection = {"_id": 0, "customer_id": 1, "period": 1, **{col: 1 for col in ROLLUP_VALUE_COLUMNS}}
+        async for doc in source.transaction_rollups.find(query, projection):
+            rows.append((doc['customer_id'], doc['period'], doc['amount'], doc['count'], doc.get('international_count', 0)))
+        if not rows:
+            return 0
+        monthly = pd.DataFrame(rows, columns=['customer_id', 'period'] + ROLLUP_VALUE_COLUMNS)
+        monthly['period'] = pd.to_datetime(monthly['period'])
+        features = await run_in_threadpool(compute_derived_features, monthly)
+        operations = [
+            UpdateOne({"id": customer_id}, {"$set": dict(zip(DERIVED_FEATURE_COLUMNS, values))})
+            for customer_id, *values in zip(*(features[col].tolist() for col in ['id'] + DERIVED_FEATURE_COLUMNS))
+        ]
+        # Rollups may belong to customer ids without a customer document; only matched ones count
+        return (await bulk_write_batches(db.customers, operations))["matched_count"]
+    
+    customers_derived = 0
+    chunks = 0
+    if customer_ids is not None:
+        ids = list(customer_ids)
+        for start in range(0, len(ids), SEGMENTATION_CHUNK_SIZE):
+            customers_derived += await derive_chunk(ids[start:start + SEGMENTATION_CHUNK_SIZE])
+            chunks += 1
+    else:
+        chunk = []
+        async for doc in source.customers.find({}, {"_id": 0, "id": 1}).batch_size(SEGMENTATION_CHUNK_SIZE):
+            chunk.append(doc['id'])
+            if len(chunk) >= SEGMENTATION_CHUNK_SIZE:
+                customers_derived += await derive_chunk(chunk)
+                chunks += 1
+                chunk = []
+        if chunk:
+            customers_derived += await derive_chunk(chunk)
+            chunks += 1
+    await invalidate_feature_snapshot()
     
-    segment_means = df.groupby('segment_id')[features].mean()
+    # Segment averages are computed from these features, so cached segment views are stale too
+    totals = await db.customers.aggregate([{"$group": {"_id": None, "spend": {"$sum": "$monthly_spend"}}}]).to_list(1)
+    await update_dashboard_summary(
+        {"total_spend": float(totals[0]['spend']) if totals else 0.0},
+        inc_fields={"segmentation_version": 1}
+    )
+    return {
+        "customers_derived": customers_derived,
+        "chunks": chunks,
+        "derive_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+SEGMENT_FEATURES = ['monthly_spend', 'spend_volatility', 'international_ratio', 'payment_timeliness_score']
+MIN_SEGMENTATION_CUSTOMERS = 4
+SEGMENT_NAMES = {
+    0: "High-Growth Corporates",
+    1: "Travel-Heavy Corporates",
+    2: "Low-Engagement / At-Risk",
+    3: "Stable Mature Accounts"
+}
+
+def name_segments(features: pd.DataFrame, labels: np.ndarray, n_clusters: int) -> Dict[int, str]:
+    """Map cluster ids to business segment names using median heuristics"""
+    segment_means = features.groupby(labels)[SEGMENT_FEATURES].mean()
     
     assigned_names = {}
     for seg_id in range(n_clusters):
-        if segment_means.loc[seg_id, 'monthly_spend'] > df['monthly_spend'].median() * 1.5:
+        if segment_means.loc[seg_id, 'monthly_spend'] > features['monthly_spend'].median() * 1.5:
             assigned_names[seg_id] = "High-Growth Corporates"
-        elif segment_means.loc[seg_id, 'international_ratio'] > df['international_ratio'].median() * 1.3:
+        elif segment_means.loc[seg_id, 'international_ratio'] > features['international_ratio'].median() * 1.3:
             assigned_names[seg_id] = "Travel-Heavy Corporates"
-        elif segment_means.loc[seg_id, 'payment_timeliness_score'] < df['payment_timeliness_score'].median() * 0.8:
+        elif segment_means.loc[seg_id, 'payment_timeliness_score'] < features['payment_timeliness_score'].median() * 0.8:
             assigned_names[seg_id] = "Low-Engagement / At-Risk"
         else:
             assigned_names[seg_id] = "Stable Mature Accounts"
@@ -141,162 +877,713 @@ async def run_segmentation():
     used_names = set()
     final_names = {}
     for seg_id, name in assigned_names.items():
-        if name not in used_names:
-            final_names[seg_id] = name
-            used_names.add(name)
-        else:
-            for backup_name in segment_names.values():
-                if backup_name not in used_names:
-                    final_names[seg_id] = backup_name
-                    used_names.add(backup_name)
-                    break
+        if name in used_names:
+            name = next((backup for backup in SEGMENT_NAMES.values() if backup not in used_names), name)
+        if name in used_names:
+            # More clusters than business names: number the repeats, e.g. "Stable Mature Accounts 2"
+            suffix = 2
+            while f"{name} {suffix}" in used_names:
+                suffix += 1
+            name = f"{name} {suffix}"
+        final_names[seg_id] = name
+        used_names.add(name)
+    return final_names
+
+def base_segment_name(segment_name: Optional[str]) -> Optional[str]:
+    """Strip the number name_segments appends to repeated segment names"""
+    head, _, tail = (segment_name or "").rpartition(" ")
+    return head if head and tail.isdigit() else segment_name
+
+def fit_segments(X: np.ndarray, n_clusters: Optional[int] = None):
+    """Scale, cluster and name customer feature rows (CPU-bound, runs in a worker process)"""
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
     
-    df['segment'] = df['segment_id'].map(final_names)
+    n_clusters = min(n_clusters or 4, len(X))  # Ensure we don't create more clusters than customers
+    if len(X) > MINIBATCH_THRESHOLD:
+        algorithm = "minibatch_kmeans"
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=MINIBATCH_SIZE)
+    else:
+        algorithm = "kmeans"
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(X_scaled).astype(np.int32)
     
-    for _, row in df.iterrows():
-        await db.customers.update_one(
-            {"id": row['id']},
-            {"$set": {
-                "segment": row['segment'],
-                "segment_id": int(row['segment_id']),
-                "total_transactions": int(row['total_transactions']),
-                "avg_transaction_value": float(row['avg_transaction_value']),
-                "top_merchant_category": row['top_merchant_category']
-            }}
+    final_names = name_segments(pd.DataFrame(X, columns=SEGMENT_FEATURES), labels, n_clusters)
+    model = {
+        "features": SEGMENT_FEATURES,
+        "algorithm": algorithm,
+        "n_clusters": n_clusters,
+        "scaler_mean": scaler.mean_.tolist(),
+        "scaler_scale": scaler.scale_.tolist(),
+        "centroids": kmeans.cluster_centers_.tolist(),
+        "segment_names": {str(seg_id): name for seg_id, name in final_names.items()}
+    }
+    return labels, model
+
+K_CRITERIA = ("silhouette", "inertia")
+
+def evaluate_k(X: np.ndarray, k: int) -> Dict[str, Any]:
+    """Fit one candidate k on a (sub)sample and score it (runs in a worker process)"""
+    started = time.perf_counter()
+    X_scaled = StandardScaler().fit_transform(X)
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(X_scaled)
+    fitted = time.perf_counter()
+    silhouette = silhouette_score(X_scaled, labels, sample_size=min(len(X_scaled), SILHOUETTE_SAMPLE_SIZE), random_state=42)
+    return {
+        "k": k,
+        "inertia": float(kmeans.inertia_),
+        "silhouette": float(silhouette),
+        "fit_ms": round((fitted - started) * 1000, 2),
+        "score_ms": round((time.perf_counter() - fitted) * 1000, 2)
+    }
+
+def elbow_k(candidates: List[Dict[str, Any]]) -> int:
+    """Pick the k whose normalized inertia lies furthest below the first-to-last chord"""
+    ks = np.array([c["k"] for c in candidates], dtype=float)
+    inertia = np.array([c["inertia"] for c in candidates])
+    if len(ks) < 3 or inertia[0] == inertia[-1]:
+        return int(ks[0])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertia - inertia[-1]) / (inertia[0] - inertia[-1])
+    return int(ks[np.argmax((1 - x) - y)])
+
+async def select_k(X: np.ndarray, criterion: str = "silhouette") -> Dict[str, Any]:
+    """Evaluate every candidate k concurrently in the process pool on a shared subsample"""
+    started = time.perf_counter()
+    sample = X
+    if len(X) > AUTO_K_SAMPLE_SIZE:
+        sample = X[np.sort(np.random.default_rng(42).choice(len(X), AUTO_K_SAMPLE_SIZE, replace=False))]
+    ks = range(AUTO_K_MIN, max(AUTO_K_MIN, min(AUTO_K_MAX, len(sample) - 1)) + 1)
+    candidates = await asyncio.gather(*(run_in_process(evaluate_k, sample, k) for k in ks))
+    
+    if criterion == "inertia":
+        chosen_k = elbow_k(candidates)
+    else:
+        chosen_k = max(candidates, key=lambda c: (c["silhouette"], -c["k"]))["k"]
+    return {
+        "criterion": criterion,
+        "chosen_k": chosen_k,
+        "sample_size": len(sample),
+        "candidates": candidates,
+        "selection_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def predict_segments(model: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Assign feature rows to the nearest centroid of a fitted segmentation model"""
+    X_scaled = (X - np.asarray(model["scaler_mean"])) / np.asarray(model["scaler_scale"])
+    centroids = np.asarray(model["centroids"])
+    distances = ((X_scaled[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1).astype(np.int32)
+
+def model_segment_names(model: Dict[str, Any]) -> Dict[int, str]:
+    return {int(seg_id): name for seg_id, name in model["segment_names"].items()}
+
+async def next_segment_model_version() -> int:
+    """Allocate a model version atomically from a counter in the dashboard summary
+    
+    The counter is first raised to the latest stored version, which seeds it
+    on databases whose models predate it; $max and $inc keep concurrent
+    segmentations from getting the same version.
+    """
+    latest = await db.segment_models.find_one({}, {"_id": 0, "version": 1}, sort=[("version", -1)])
+    if latest:
+        await db.summaries.update_one(
+            {"_id": DASHBOARD_SUMMARY_ID}, {"$max": {"segment_model_version": latest["version"]}}, upsert=True
         )
+    counter = await db.summaries.find_one_and_update(
+        {"_id": DASHBOARD_SUMMARY_ID},
+        {"$inc": {"segment_model_version": 1}},
+        projection={"segment_model_version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["segment_model_version"]
+
+async def save_segment_model(model: Dict[str, Any], customers_fitted: int) -> Dict[str, Any]:
+    """Persist a fitted segmentation model as the next version"""
+    model = {
+        **model,
+        "version": await next_segment_model_version(),
+        "customers_fitted": customers_fitted,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.segment_models.insert_one(dict(model))
+    return model
+
+async def get_active_segment_model() -> Optional[Dict[str, Any]]:
+    """Load the most recent segmentation model"""
+    return await db.segment_models.find_one({}, {"_id": 0}, sort=[("version", -1)])
+
+def feature_snapshot_dir() -> Path:
+    return Path(FEATURE_SNAPSHOT_DIR) / db.name
+
+def write_feature_snapshot(directory: Path, token: str, ids, X: np.ndarray):
+    """Persist ids and the feature matrix as .npy files, publishing them via meta.json"""
+    directory.mkdir(parents=True, exist_ok=True)
+    np.save(directory / f"features-{token}.npy", np.ascontiguousarray(X, dtype=np.float32))
+    np.save(directory / f"ids-{token}.npy", np.asarray(ids, dtype=str))
+    meta = directory / f"meta-{token}.tmp"
+    meta.write_text(json.dumps({"token": token, "features": SEGMENT_FEATURES, "rows": len(ids)}))
+    os.replace(meta, directory / "meta.json")
+    for stale in directory.glob("*.npy"):
+        if token not in stale.name:
+            stale.unlink(missing_ok=True)
+
+def read_feature_snapshot(directory: Path, token: str):
+    """Memory-map the snapshot if it was written for this token, else return None"""
+    try:
+        meta = json.loads((directory / "meta.json").read_text())
+        if meta.get("token") != token or meta.get("features") != SEGMENT_FEATURES:
+            return None
+        X = np.load(directory / f"features-{token}.npy", mmap_mode='r')
+        ids = np.load(directory / f"ids-{token}.npy", mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    return ids.tolist(), X
+
+async def get_features_token() -> Optional[str]:
+    summary = await db.summaries.find_one({"_id": DASHBOARD_SUMMARY_ID}, {"features_token": 1})
+    return summary.get('features_token') if summary else None
+
+async def invalidate_feature_snapshot():
+    """Drop the current token around a rewrite of customer features
     
-    return {"message": "Segmentation completed", "segments_created": n_clusters}
+    Writers call this before and again after their writes: a full load that
+    starts in between sets a token and may read half-written customers, and
+    the second call retires that token so its snapshot is never trusted.
+    """
+    await db.summaries.update_one({"_id": DASHBOARD_SUMMARY_ID}, {"$unset": {"features_token": ""}})
 
-@api_router.get("/data/seed")
-@api_router.post("/data/seed")
-async def seed_data():
-    """Generate synthetic corporate card data"""
-    await db.customers.delete_many({})
-    await db.transactions.delete_many({})
+async def save_feature_snapshot(token: str, ids, X: np.ndarray):
+    if not FEATURE_SNAPSHOT_DIR:
+        return
+    try:
+        await run_in_threadpool(write_feature_snapshot, feature_snapshot_dir(), token, ids, X)
+    except OSError as e:
+        logger.warning("Could not write feature snapshot: %s", e)
+
+async def load_segment_features(query: Optional[Dict[str, Any]] = None, source=None):
+    """Load customers' ids and segmentation features as a compact float32 matrix
     
-    merchant_categories = [
-        "Travel & Transportation", "Hotels & Lodging", "Restaurants",
-        "Office Supplies", "Technology & Software", "Professional Services",
-        "Marketing & Advertising", "Utilities", "Shipping & Logistics"
-    ]
+    A full load is served from the on-disk snapshot when its token matches the
+    one in the dashboard summary; otherwise the customers are streamed from
+    MongoDB and the snapshot is rebuilt for the next run. Full loads read
+    through analytics_source unless given a source; targeted loads score
+    customers that were just written, so they always read from db.
+    """
+    token = None
+    if query is None and FEATURE_SNAPSHOT_DIR:
+        token = await get_features_token()
+        if token:
+            snapshot = await run_in_threadpool(read_feature_snapshot, feature_snapshot_dir(), token)
+            if snapshot is not None:
+                return snapshot
+        else:
+            token = uuid.uuid4().hex
+            await db.summaries.update_one({"_id": DASHBOARD_SUMMARY_ID}, {"$set": {"features_token": token}}, upsert=True)
     
-    company_names = [
-        "TechCorp Solutions", "Global Ventures Ltd", "Innovation Labs Inc",
-        "Summit Consulting Group", "Nexus Technologies", "Apex Financial Services",
-        "Horizon Enterprises", "Velocity Systems", "Fusion Analytics",
-        "Pinnacle Solutions", "Quantum Dynamics", "Stellar Industries"
+    ids = []
+    blocks = []
+    rows = []
+    projection = {"_id": 0, "id": 1, **{f: 1 for f in SEGMENT_FEATURES}}
+    if query is not None:
+        source = db
+    elif source is None:
+        source = await analytics_source()
+    async for doc in source.customers.find(query or {}, projection).batch_size(SEGMENTATION_CHUNK_SIZE):
+        ids.append(doc['id'])
+        rows.append([doc.get(f, np.nan) for f in SEGMENT_FEATURES])
+        if len(rows) >= SEGMENTATION_CHUNK_SIZE:
+            blocks.append(np.asarray(rows, dtype=np.float32))
+            rows = []
+    if rows:
+        blocks.append(np.asarray(rows, dtype=np.float32))
+    X = np.vstack(blocks) if blocks else np.empty((0, len(SEGMENT_FEATURES)), dtype=np.float32)
+    if token:
+        await save_feature_snapshot(token, ids, X)
+    return ids, X
+
+def segment_updates(ids: List[str], labels: np.ndarray, totals: Dict[str, Dict[str, Any]], model: Dict[str, Any]) -> List[UpdateOne]:
+    """Build one chunk's segment and transaction statistics updates (CPU-bound, runs in the threadpool)"""
+    empty_stats = transaction_stats_update(0, 0.0, "", 0.0, {})
+    columns = TRANSACTION_FEATURE_COLUMNS + TRANSACTION_COUNTER_COLUMNS
+    final_names = model_segment_names(model)
+    stats = transaction_features(totals)
+    stats_by_id = {
+        customer_id: transaction_stats_update(*values)
+        for customer_id, *values in zip(stats['id'].tolist(), *(stats[col].tolist() for col in columns))
+    }
+    return [
+        UpdateOne(
+            {"id": customer_id},
+            {"$set": {
+                "segment": final_names[segment_id],
+                "segment_id": segment_id,
+                "segment_model_version": model["version"],
+                **stats_by_id.get(customer_id, empty_stats)
+            }}
+        )
+        for customer_id, segment_id in zip(ids, labels.tolist())
     ]
+
+async def write_segments(ids: List[str], labels: np.ndarray, model: Dict[str, Any]) -> Dict[str, Any]:
+    """Write segment assignments and refreshed transaction statistics back chunk by chunk"""
+    started = time.perf_counter()
+    batches = 0
+    for start in range(0, len(ids), SEGMENTATION_CHUNK_SIZE):
+        chunk_ids = ids[start:start + SEGMENTATION_CHUNK_SIZE]
+        totals = await aggregate_transaction_totals(chunk_ids)
+        operations = await run_in_threadpool(
+            segment_updates, chunk_ids, labels[start:start + SEGMENTATION_CHUNK_SIZE], totals, model
+        )
+        batches += (await bulk_write_batches(db.customers, operations))["write_batches"]
+    return {
+        "write_batches": batches,
+        "write_latency_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+async def run_segmentation(auto_k: bool = False, criterion: str = "silhouette", source=None):
+    """Run K-Means clustering on customer data
     
-    customers_data = []
-    transactions_data = []
+    With auto_k the cluster count is chosen by select_k instead of the fixed 4.
+    Pass source=db when customers were just written without a version bump.
+    """
+    started = time.perf_counter()
+    with timing_span("segmentation.load"):
+        ids, X = await load_segment_features(source=source)
     
-    for i in range(150):
-        customer_id = str(uuid.uuid4())
-        
-        base_spend = random.choice([5000, 15000, 30000, 50000, 80000, 120000])
-        volatility = random.uniform(0.1, 0.8)
-        international_ratio = random.uniform(0, 0.7)
-        timeliness = random.uniform(0.6, 1.0)
-        
-        customer = {
+    if len(ids) < MIN_SEGMENTATION_CUSTOMERS:
+        raise HTTPException(status_code=400, detail="Not enough customers for segmentation")
+    loaded = time.perf_counter()
+    
+    k_selection = None
+    if auto_k:
+        with timing_span("segmentation.select_k"):
+            k_selection = await select_k(X, criterion)
+    
+    with timing_span("segmentation.fit"):
+        labels, model = await run_in_process(fit_segments, X, k_selection["chosen_k"] if k_selection else None)
+    with timing_span("segmentation.save_model"):
+        model = await save_segment_model(model, len(ids))
+    fitted = time.perf_counter()
+    
+    with timing_span("segmentation.write"):
+        write_stats = await write_segments(ids, labels, model)
+    counts = np.bincount(labels, minlength=model["n_clusters"])
+    final_names = model_segment_names(model)
+    with timing_span("segmentation.summary"):
+        await update_dashboard_summary({
+            "total_customers": len(ids),
+            "segment_counts": {final_names[seg_id]: int(count) for seg_id, count in enumerate(counts)}
+        }, inc_fields={"segmentation_version": 1})
+    
+    return {
+        "message": "Segmentation completed",
+        "segments_created": model["n_clusters"],
+        "customers_segmented": len(ids),
+        "algorithm": model["algorithm"],
+        "model_version": model["version"],
+        **write_stats,
+        "timings_ms": {
+            "load": round((loaded - started) * 1000, 2),
+            "fit": round((fitted - loaded) * 1000, 2),
+            "write": write_stats["write_latency_ms"]
+        },
+        "k_selection": k_selection
+    }
+
+MERCHANT_CATEGORIES = [
+    "Travel & Transportation", "Hotels & Lodging", "Restaurants",
+    "Office Supplies", "Technology & Software", "Professional Services",
+    "Marketing & Advertising", "Utilities", "Shipping & Logistics"
+]
+COMPANY_NAMES = [
+    "TechCorp Solutions", "Global Ventures Ltd", "Innovation Labs Inc",
+    "Summit Consulting Group", "Nexus Technologies", "Apex Financial Services",
+    "Horizon Enterprises", "Velocity Systems", "Fusion Analytics",
+    "Pinnacle Solutions", "Quantum Dynamics", "Stellar Industries"
+]
+MERCHANT_PREFIXES = ['Acme', 'Global', 'Premier', 'Express']
+BASE_SPEND_LEVELS = [5000, 15000, 30000, 50000, 80000, 120000]
+
+def random_uuids(rng: np.random.Generator, count: int) -> List[str]:
+    """Generate reproducible version-4 UUID strings in bulk"""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80
+    h = raw.tobytes().hex()
+    return [f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}" for i in range(0, len(h), 32)]
+
+def generate_customers(rng: np.random.Generator, count: int) -> Dict[str, np.ndarray]:
+    """Draw synthetic customer profiles as columns"""
+    return {
+        "id": np.array(random_uuids(rng, count), dtype=object),
+        "company_name": np.char.add(
+            np.char.add(np.array(COMPANY_NAMES)[rng.integers(0, len(COMPANY_NAMES), count)], " "),
+            np.arange(1, count + 1).astype(str)
+        ),
+        "monthly_spend": rng.choice(BASE_SPEND_LEVELS, count).astype(float),
+        "spend_volatility": rng.uniform(0.1, 0.8, count),
+        "international_ratio": rng.uniform(0, 0.7, count),
+        "payment_timeliness_score": rng.uniform(0.6, 1.0, count)
+    }
+
+def seed_customer_documents(profiles: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Unsegmented customer documents for generated profiles"""
+    return [
+        {
             "id": customer_id,
-            "company_name": f"{random.choice(company_names)} {i+1}",
-            "monthly_spend": float(base_spend),
-            "spend_volatility": float(volatility),
-            "international_ratio": float(international_ratio),
-            "payment_timeliness_score": float(timeliness),
+            "company_name": company_name,
+            "monthly_spend": monthly_spend,
+            "spend_volatility": volatility,
+            "international_ratio": international_ratio,
+            "payment_timeliness_score": timeliness,
             "segment": None,
             "segment_id": None,
             "total_transactions": 0,
             "avg_transaction_value": 0.0,
             "top_merchant_category": ""
         }
-        customers_data.append(customer)
-        
-        num_transactions = random.randint(20, 100)
-        customer_transactions = []
-        
-        for _ in range(num_transactions):
-            amount = abs(np.random.normal(base_spend / num_transactions, base_spend * volatility / num_transactions))
-            is_international = random.random() < international_ratio
-            
-            transaction = {
-                "id": str(uuid.uuid4()),
-                "customer_id": customer_id,
-                "amount": round(amount, 2),
-                "merchant_category": random.choice(merchant_categories),
-                "is_international": is_international,
-                "transaction_date": (datetime.now(timezone.utc) - timedelta(days=random.randint(0, 90))).isoformat(),
-                "merchant_name": f"{random.choice(['Acme', 'Global', 'Premier', 'Express'])} {random.choice(merchant_categories).split()[0]}"
-            }
-            customer_transactions.append(transaction)
-        
-        transactions_data.extend(customer_transactions)
+        for customer_id, company_name, monthly_spend, volatility, international_ratio, timeliness in zip(
+            *(profiles[col].tolist() for col in ['id'] + CUSTOMER_COLUMNS)
+        )
+    ]
+
+def generate_transactions(rng: np.random.Generator, customers: Dict[str, np.ndarray], counts: np.ndarray, now: datetime) -> List[Dict[str, Any]]:
+    """Draw transactions for a block of customers column-wise and zip them into documents"""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    total = len(owner)
+    per_customer = counts[owner]
+    base_spend = customers["monthly_spend"][owner]
+    
+    amounts = np.round(np.abs(rng.normal(base_spend / per_customer, base_spend * customers["spend_volatility"][owner] / per_customer)), 2)
+    is_international = rng.random(total) < customers["international_ratio"][owner]
+    categories = np.array(MERCHANT_CATEGORIES, dtype=object)[rng.integers(0, len(MERCHANT_CATEGORIES), total)]
+    date_choices = np.array([now - timedelta(days=d) for d in range(91)], dtype=object)
+    dates = date_choices[rng.integers(0, 91, total)]
+    merchant_choices = np.array([f"{p} {c.split()[0]}" for p in MERCHANT_PREFIXES for c in MERCHANT_CATEGORIES], dtype=object)
+    merchants = merchant_choices[rng.integers(0, len(merchant_choices), total)]
+    
+    columns = zip(
+        random_uuids(rng, total), customers["id"][owner].tolist(), amounts.tolist(), categories.tolist(),
+        is_international.tolist(), dates.tolist(), merchants.tolist()
+    )
+    return [
+        {
+            "id": txn_id,
+            "customer_id": customer_id,
+            "amount": amount,
+            "merchant_category": category,
+            "is_international": international,
+            "transaction_date": date,
+            "merchant_name": merchant
+        }
+        for txn_id, customer_id, amount, category, international, date, merchant in columns
+    ]
+
+def generate_transaction_block(rng: np.random.Generator, customers: Dict[str, np.ndarray], counts: np.ndarray, now: datetime):
+    """Generate one block's transactions and their rollup documents, off the event loop"""
+    transactions = generate_transactions(rng, customers, counts, now)
+    rollups = build_rollups(pd.DataFrame.from_records(transactions, columns=TRANSACTION_COLUMNS))
+    return transactions, rollup_documents(rollups)
+
+async def insert_parallel(collection, documents: List[Dict[str, Any]]):
+    """Insert documents as concurrent unordered batches"""
+    semaphore = asyncio.Semaphore(SEED_INSERT_CONCURRENCY)
     
-    if customers_data:
-        await db.customers.insert_many(customers_data)
-    if transactions_data:
-        await db.transactions.insert_many(transactions_data)
+    async def insert(batch):
+        async with semaphore:
+            await collection.insert_many(batch, ordered=False)
+    
+    await asyncio.gather(*(
+        insert(documents[start:start + WRITE_BATCH_SIZE])
+        for start in range(0, len(documents), WRITE_BATCH_SIZE)
+    ))
+
+@api_router.get("/data/seed")
+@api_router.post("/data/seed")
+async def seed_data(
+    customers: int = Query(150, ge=4, le=MAX_SEED_CUSTOMERS),
+    transactions_per_customer: Optional[int] = Query(None, ge=1, le=10000),
+    seed: Optional[int] = None
+):
+    """Generate synthetic corporate card data
+    
+    Customers get transactions_per_customer transactions each, or 20-100 when
+    it is not given; the same seed reproduces the same portfolio. Columns are
+    drawn with NumPy per block of customers, off the event loop, and inserted
+    in parallel batches.
+    """
+    await invalidate_feature_snapshot()
+    await db.customers.delete_many({})
+    await db.transactions.delete_many({})
+    
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    profiles = await run_in_threadpool(generate_customers, rng, customers)
+    if transactions_per_customer:
+        counts = np.full(customers, transactions_per_customer)
+    else:
+        counts = rng.integers(20, 101, customers)
+    
+    customers_data = await run_in_threadpool(seed_customer_documents, profiles)
+    await insert_parallel(db.customers, customers_data)
+    
+    # Transactions are generated and inserted a block of customers at a time to bound memory;
+    # blocks hold disjoint customers, so their rollups never share a bucket
+    block_size = max(1, SEED_BLOCK_TRANSACTIONS // int(counts.max()))
+    transactions_created = 0
+    await db.transaction_rollups.delete_many({})
+    for start in range(0, customers, block_size):
+        block = {col: values[start:start + block_size] for col, values in profiles.items()}
+        transactions_data, rollup_docs = await run_in_threadpool(
+            generate_transaction_block, rng, block, counts[start:start + block_size], now
+        )
+        await insert_parallel(db.transactions, transactions_data)
+        await insert_parallel(db.transaction_rollups, rollup_docs)
+        transactions_created += len(transactions_data)
+    generated = time.perf_counter()
+    
+    features_token = uuid.uuid4().hex
+    await update_dashboard_summary({
+        "total_customers": len(customers_data),
+        "total_spend": float(profiles["monthly_spend"].sum()),
+        "total_transactions": transactions_created,
+        "segment_counts": {"Unassigned": len(customers_data)},
+        "features_token": features_token
+    }, inc_fields={"segmentation_version": 1})
+    await save_feature_snapshot(features_token, profiles['id'], np.column_stack([profiles[f] for f in SEGMENT_FEATURES]))
     
     # Run segmentation after seeding
     segmentation_result = await run_segmentation()
+    elapsed = generated - started
     
     return {
         "message": "Data seeded successfully with segmentation",
         "customers_created": len(customers_data),
-        "transactions_created": len(transactions_data),
+        "transactions_created": transactions_created,
+        "seed": seed,
+        "generation_seconds": round(elapsed, 3),
+        "transactions_per_second": round(transactions_created / elapsed, 1) if elapsed > 0 else None,
         "segmentation": segmentation_result
     }
 
 @api_router.post("/data/reset-and-seed")
-async def reset_and_seed():
+async def reset_and_seed(
+    customers: int = Query(150, ge=4, le=MAX_SEED_CUSTOMERS),
+    transactions_per_customer: Optional[int] = Query(None, ge=1, le=10000),
+    seed: Optional[int] = None
+):
     """Reset database and seed fresh data with segmentation"""
     await db.customers.delete_many({})
     await db.transactions.delete_many({})
     
-    result = await seed_data()
+    result = await seed_data(customers, transactions_per_customer, seed)
     return {
         "message": "Database reset and seeded successfully",
         **result
     }
 
-@api_router.post("/analyze")
-async def analyze_endpoint():
-    """Public endpoint to run segmentation"""
-    return await run_segmentation()
+@api_router.post("/analyze", status_code=202)
+async def analyze_endpoint(derive_features: bool = False, auto_k: bool = False, criterion: str = "silhouette"):
+    """Public endpoint to run segmentation as a background job
+    
+    With derive_features=true the behavior features are first recomputed from
+    the transactions for every customer; with auto_k=true the cluster count is
+    chosen by silhouette or inertia (elbow) criterion.
+    """
+    if criterion not in K_CRITERIA:
+        raise HTTPException(status_code=400, detail=f"criterion must be one of: {', '.join(K_CRITERIA)}")
+    
+    async def analyze():
+        if not derive_features:
+            return await run_segmentation(auto_k, criterion)
+        derived = await derive_customer_features()
+        return {**(await run_segmentation(auto_k, criterion)), "feature_derivation": derived}
+    
+    job = submit_job("segmentation", analyze, key=f"segmentation:{derive_features}:{auto_k}:{criterion}")
+    return {
+        "message": "Segmentation job submitted",
+        "job_id": job["id"],
+        "status": job["status"]
+    }
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get status, timings and result of a background job"""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+CUSTOMER_COLUMNS = ['company_name', 'monthly_spend', 'spend_volatility', 'international_ratio', 'payment_timeliness_score']
+CUSTOMER_RATIO_COLUMNS = ['spend_volatility', 'international_ratio', 'payment_timeliness_score']
+MAX_REPORTED_ERRORS = 100
+
+def validate_customer_frame(df: pd.DataFrame, first_row: int = 2):
+    """Coerce and range-check customer columns, returning valid rows and a row-level error report
+    
+    Rows are reported from first_row: the default matches CSV line numbers
+    (the header is line 1); columnar formats pass 1 for data row numbers.
+    """
+    converted = pd.DataFrame({"company_name": df['company_name'].astype("string").str.strip()}, index=df.index)
+    problems = [(converted['company_name'].isna() | (converted['company_name'] == ""), "company_name: missing")]
+    
+    if 'customer_id' in df.columns:
+        customer_ids = df['customer_id'].astype("string").str.strip()
+        missing = customer_ids.isna() | (customer_ids == "")
+        problems.append((missing, "customer_id: missing"))
+        problems.append((~missing & customer_ids.duplicated(), "customer_id: duplicate of an earlier row"))
+        converted['customer_id'] = customer_ids
+    
+    for col in ['monthly_spend'] + CUSTOMER_RATIO_COLUMNS:
+        values = pd.to_numeric(df[col], errors='coerce').astype(float)
+        not_numeric = values.isna() | ~np.isfinite(values)
+        problems.append((not_numeric, f"{col}: not a number"))
+        if col in CUSTOMER_RATIO_COLUMNS:
+            problems.append((~not_numeric & ((values < 0) | (values > 1)), f"{col}: must be between 0 and 1"))
+        else:
+            problems.append((~not_numeric & (values < 0), f"{col}: must not be negative"))
+        converted[col] = values
+    
+    invalid = np.zeros(len(df), dtype=bool)
+    for mask, _ in problems:
+        invalid |= mask.to_numpy()
+    
+    errors = {}
+    for mask, message in problems:
+        for position in np.flatnonzero(mask.to_numpy()):
+            errors.setdefault(int(position) + first_row, []).append(message)
+    error_report = [{"row": row, "errors": errors[row]} for row in sorted(errors)[:MAX_REPORTED_ERRORS]]
+    
+    return converted[~invalid], int(invalid.sum()), error_report
+
+UPLOAD_FORMAT_LABELS = {"csv": "CSV", "parquet": "Parquet file", "arrow": "Arrow file"}
+
+def detect_upload_format(file: UploadFile) -> str:
+    """Tell Parquet and Arrow IPC uploads from CSV by their magic bytes"""
+    head = file.file.read(8)
+    file.file.seek(0)
+    if head[:4] == b"PAR1":
+        upload_format = "parquet"
+    elif head[:6] == b"ARROW1" or head[:4] == b"\xff\xff\xff\xff":
+        upload_format = "arrow"
+    else:
+        return "csv"
+    if pyarrow is None:
+        raise HTTPException(status_code=400, detail=f"{UPLOAD_FORMAT_LABELS[upload_format]} uploads require pyarrow on the server")
+    return upload_format
+
+def arrow_record_batches(source):
+    """Iterate the record batches of an Arrow IPC file or stream"""
+    if source.read(6) == b"ARROW1":
+        source.seek(0)
+        reader = pyarrow.ipc.open_file(source)
+        return (reader.get_batch(i) for i in range(reader.num_record_batches))
+    source.seek(0)
+    return iter(pyarrow.ipc.open_stream(source))
+
+def iter_upload_frames(file: UploadFile, upload_format: str):
+    """Yield frames of at most INGEST_CHUNK_SIZE rows from a CSV, Parquet or Arrow IPC upload
+    
+    Parquet is read row group by row group and Arrow batch by batch, keeping
+    the file's column types instead of parsing text.
+    """
+    if upload_format == "csv":
+        yield from pd.read_csv(file.file, chunksize=INGEST_CHUNK_SIZE, encoding='utf-8')
+        return
+    if upload_format == "parquet":
+        batches = pyarrow.parquet.ParquetFile(file.file).iter_batches(batch_size=INGEST_CHUNK_SIZE)
+    else:
+        batches = arrow_record_batches(file.file)
+    for batch in batches:
+        for start in range(0, batch.num_rows, INGEST_CHUNK_SIZE):
+            yield batch.slice(start, INGEST_CHUNK_SIZE).to_pandas()
+
+def read_upload_frame(file: UploadFile, upload_format: str) -> pd.DataFrame:
+    if upload_format == "csv":
+        return pd.read_csv(file.file, encoding='utf-8')
+    frames = list(iter_upload_frames(file, upload_format))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 @api_router.post("/data/upload-customers")
-async def upload_customers(file: UploadFile = File(...)):
-    """Upload customers from CSV file"""
+async def upload_customers(file: UploadFile = File(...), mode: str = "replace"):
+    """Upload customers from a CSV, Parquet or Arrow IPC file
+    
+    Rows are validated column-wise before anything is written; invalid rows are
+    skipped and reported by CSV line number while the valid ones are loaded.
+    An optional customer_id column sets the id transactions refer to. In
+    replace mode the customers are loaded into a staging collection that is
+    swapped in once complete; in upsert mode (customer_id required) they are
+    updated or inserted by id and only they are re-scored against the current
+    segmentation model.
+    """
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
+        if mode not in ("replace", "upsert"):
+            raise HTTPException(status_code=400, detail="mode must be 'replace' or 'upsert'")
+        
+        upload_format = detect_upload_format(file)
+        with timing_span("upload_customers.parse"):
+            df = await run_in_threadpool(read_upload_frame, file, upload_format)
+        
+        if not all(col in df.columns for col in CUSTOMER_COLUMNS):
+            raise HTTPException(status_code=400, detail=f"{UPLOAD_FORMAT_LABELS[upload_format]} must contain columns: {', '.join(CUSTOMER_COLUMNS)}")
+        if mode == "upsert" and 'customer_id' not in df.columns:
+            raise HTTPException(status_code=400, detail="mode=upsert requires a customer_id column")
         
-        required_columns = ['company_name', 'monthly_spend', 'spend_volatility', 'international_ratio', 'payment_timeliness_score']
-        if not all(col in df.columns for col in required_columns):
-            raise HTTPException(status_code=400, detail=f"CSV must contain columns: {', '.join(required_columns)}")
+        with timing_span("upload_customers.validate"):
+            valid, rows_rejected, error_report = await run_in_threadpool(
+                validate_customer_frame, df, 2 if upload_format == "csv" else 1
+            )
+        if valid.empty:
+            summary = "; ".join(f"row {e['row']}: {', '.join(e['errors'])}" for e in error_report[:5])
+            raise HTTPException(status_code=400, detail=f"No valid customer rows ({rows_rejected} rejected). {summary}")
+        if mode == "replace" and len(valid) < MIN_SEGMENTATION_CUSTOMERS:
+            # Checked before staging so the live customers are never replaced by a set that cannot be segmented
+            raise HTTPException(
+                status_code=400,
+                detail=f"Not enough customers for segmentation: {len(valid)} valid rows, at least {MIN_SEGMENTATION_CUSTOMERS} needed ({rows_rejected} rejected)"
+            )
         
-        await db.customers.delete_many({})
+        if 'customer_id' in valid.columns:
+            ids = valid['customer_id'].astype(object)
+        else:
+            ids = [str(uuid.uuid4()) for _ in range(len(valid))]
+        customers = valid.assign(
+            id=ids,
+            company_name=valid['company_name'].astype(object),
+            segment=None,
+            segment_id=None,
+            total_transactions=0,
+            avg_transaction_value=0.0,
+            top_merchant_category=""
+        )[['id'] + CUSTOMER_COLUMNS + ['segment', 'segment_id'] + TRANSACTION_FEATURE_COLUMNS]
         
-        customers_data = []
-        for _, row in df.iterrows():
-            customer = {
-                "id": str(uuid.uuid4()),
-                "company_name": str(row['company_name']),
-                "monthly_spend": float(row['monthly_spend']),
-                "spend_volatility": float(row['spend_volatility']),
-                "international_ratio": float(row['international_ratio']),
-                "payment_timeliness_score": float(row['payment_timeliness_score']),
-                "segment": None,
-                "segment_id": None,
-                "total_transactions": 0,
-                "avg_transaction_value": 0.0,
-                "top_merchant_category": ""
+        if mode == "upsert":
+            return {
+                "message": "Customers upserted and segmented successfully",
+                "rows_rejected": rows_rejected,
+                "errors": error_report,
+                **(await upsert_customers(customers))
             }
-            customers_data.append(customer)
         
-        if customers_data:
-            await db.customers.insert_many(customers_data)
+        with timing_span("upload_customers.insert"):
+            staging = await create_staging("customers")
+            customers_data = await run_in_threadpool(customers.to_dict, 'records')
+            for start in range(0, len(customers_data), WRITE_BATCH_SIZE):
+                await staging.insert_many(customers_data[start:start + WRITE_BATCH_SIZE], ordered=False)
+            await invalidate_feature_snapshot()
+            await swap_in_staging("customers")
+        features_token = uuid.uuid4().hex
+        await update_dashboard_summary({
+            "total_customers": len(customers_data),
+            "total_spend": float(customers['monthly_spend'].sum()),
+            "segment_counts": {"Unassigned": len(customers_data)},
+            "features_token": features_token
+        }, inc_fields={"segmentation_version": 1})
+        await save_feature_snapshot(features_token, customers['id'].to_numpy(), customers[SEGMENT_FEATURES].to_numpy(dtype=np.float32))
         
         # Run segmentation after upload
         segmentation_result = await run_segmentation()
@@ -304,91 +1591,331 @@ async def upload_customers(file: UploadFile = File(...)):
         return {
             "message": "Customers uploaded and segmented successfully",
             "customers_created": len(customers_data),
+            "rows_rejected": rows_rejected,
+            "errors": error_report,
             "segmentation": segmentation_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
 
+def customer_upserts(customers: pd.DataFrame) -> List[UpdateOne]:
+    """Build upserts by id that start new customers unsegmented and without transactions"""
+    new_customer_fields = {"segment": None, "segment_id": None, **transaction_stats_update(0, 0.0, "", 0.0, {})}
+    columns = ['id'] + CUSTOMER_COLUMNS
+    return [
+        UpdateOne(
+            {"id": values[0]},
+            {"$set": dict(zip(CUSTOMER_COLUMNS, values[1:])), "$setOnInsert": new_customer_fields},
+            upsert=True
+        )
+        for values in zip(*(customers[col].tolist() for col in columns))
+    ]
+
+async def upsert_customers(customers: pd.DataFrame) -> Dict[str, Any]:
+    """Bulk upsert customers by id, then score just those customers against the active model
+    
+    Without a model yet the whole portfolio is segmented instead.
+    """
+    operations = await run_in_threadpool(customer_upserts, customers)
+    with timing_span("upload_customers.upsert"):
+        await invalidate_feature_snapshot()
+        write_stats = await bulk_write_batches(db.customers, operations)
+        await invalidate_feature_snapshot()
+    
+    model = await get_active_segment_model()
+    if not model:
+        segmentation_result = await run_segmentation(source=db)
+    else:
+        with timing_span("upload_customers.rescore"):
+            started = time.perf_counter()
+            ids = customers['id'].tolist()
+            labels = await run_in_threadpool(predict_segments, model, customers[SEGMENT_FEATURES].to_numpy(dtype=np.float32))
+            rescore_stats = await write_segments(ids, labels, model)
+        segmentation_result = {
+            "message": "Changed customers scored against the current model",
+            "model_version": model["version"],
+            "customers_segmented": len(ids),
+            **rescore_stats,
+            "timings_ms": {"total": round((time.perf_counter() - started) * 1000, 2)}
+        }
+    await refresh_dashboard_summary(inc_fields={"segmentation_version": 1})
+    
+    return {
+        "customers_upserted": len(operations),
+        **write_stats,
+        "segmentation": segmentation_result
+    }
+
+TRANSACTION_COLUMNS = ['customer_id', 'amount', 'merchant_category', 'is_international', 'transaction_date', 'merchant_name']
+TRUE_VALUES = {"true", "t", "yes", "y", "1", "1.0"}
+
+def to_bool_column(series: pd.Series) -> pd.Series:
+    """Convert a CSV column of true/false style values to booleans"""
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    return series.astype(str).str.strip().str.lower().isin(TRUE_VALUES)
+
+def convert_transaction_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Convert a parsed CSV chunk into transaction documents column-wise"""
+    return pd.DataFrame({
+        "id": [str(uuid.uuid4()) for _ in range(len(chunk))],
+        "customer_id": chunk['customer_id'].astype(str),
+        "amount": chunk['amount'].astype(float),
+        "merchant_category": chunk['merchant_category'].astype(str),
+        "is_international": to_bool_column(chunk['is_international']),
+        "transaction_date": pd.to_datetime(chunk['transaction_date'], utc=True),
+        "merchant_name": chunk['merchant_name'].astype(str)
+    })
+
+def prepare_transaction_chunk(chunk: pd.DataFrame, delta: Dict[str, Dict[str, Any]], rollups: Optional[pd.DataFrame],
+                              upload_id: Optional[str] = None):
+    """Convert a parsed chunk into documents, folding it into the running totals and rollups
+    
+    This is the CPU-bound part of an upload, so it runs in the threadpool.
+    Rollups are folded as we go, so they grow with distinct buckets rather
+    than with the file. Documents are tagged with upload_id when given.
+    """
+    transactions = convert_transaction_chunk(chunk)
+    merge_transaction_totals(delta, summarize_transactions(transactions))
+    chunk_rollups = build_rollups(transactions)
+    rollups = chunk_rollups if rollups is None else merge_rollups([rollups, chunk_rollups])
+    if upload_id:
+        transactions = transactions.assign(upload_id=upload_id)
+    return transactions.to_dict('records'), rollups
+
 @api_router.post("/data/upload-transactions")
-async def upload_transactions(file: UploadFile = File(...)):
-    """Upload transactions from CSV file"""
+async def upload_transactions(file: UploadFile = File(...), mode: str = "replace", derive_features: bool = False):
+    """Upload transactions from a CSV, Parquet or Arrow IPC file, replacing or appending to existing ones
+    
+    The file is parsed in chunks of INGEST_CHUNK_SIZE rows straight from the
+    spooled upload, and each chunk is inserted while the next one is parsed,
+    so memory stays bounded by the chunk size rather than the file size.
+    A replacement is loaded into a staging collection and swapped in at the
+    end, so readers never see a half-loaded set. An appended file is tagged
+    with an upload_id so a failed upload can be deleted again: a 400 means
+    nothing was committed. With derive_features=true the customers in the file get monthly_spend,
+    spend_volatility and international_ratio recomputed from their transactions.
+    """
+    pending_insert = None
+    chunks = 0
+    swapped = False
+    counters_touched = False
+    upload_id = uuid.uuid4().hex if mode == "append" else None
+    delta = {}
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
+        if mode not in ("replace", "append"):
+            raise HTTPException(status_code=400, detail="mode must be 'replace' or 'append'")
         
-        required_columns = ['customer_id', 'amount', 'merchant_category', 'is_international', 'transaction_date', 'merchant_name']
-        if not all(col in df.columns for col in required_columns):
-            raise HTTPException(status_code=400, detail=f"CSV must contain columns: {', '.join(required_columns)}")
+        started = time.perf_counter()
+        upload_format = detect_upload_format(file)
+        reader = iter_upload_frames(file, upload_format)
+        rollups = None
+        transactions_created = 0
+        target = db.transactions
         
-        await db.transactions.delete_many({})
+        while True:
+            with timing_span("upload_transactions.parse"):
+                chunk = await run_in_threadpool(next, reader, None)
+            if chunk is None:
+                break
+            
+            if chunks == 0:
+                if not all(col in chunk.columns for col in TRANSACTION_COLUMNS):
+                    raise HTTPException(status_code=400, detail=f"{UPLOAD_FORMAT_LABELS[upload_format]} must contain columns: {', '.join(TRANSACTION_COLUMNS)}")
+                if mode == "replace":
+                    target = await create_staging("transactions")
+            chunks += 1
+            
+            with timing_span("upload_transactions.convert"):
+                documents, rollups = await run_in_threadpool(prepare_transaction_chunk, chunk, delta, rollups, upload_id)
+            
+            if not documents:
+                continue
+            if pending_insert is not None:
+                with timing_span("upload_transactions.insert_wait"):
+                    await pending_insert
+            pending_insert = asyncio.ensure_future(target.insert_many(documents, ordered=False))
+            transactions_created += len(documents)
         
-        transactions_data = []
-        for _, row in df.iterrows():
-            transaction = {
-                "id": str(uuid.uuid4()),
-                "customer_id": str(row['customer_id']),
-                "amount": float(row['amount']),
-                "merchant_category": str(row['merchant_category']),
-                "is_international": bool(row['is_international']),
-                "transaction_date": pd.to_datetime(row['transaction_date']).isoformat(),
-                "merchant_name": str(row['merchant_name'])
-            }
-            transactions_data.append(transaction)
+        if pending_insert is not None:
+            await pending_insert
+            pending_insert = None
+        if mode == "replace" and chunks:
+            await swap_in_staging("transactions")
+            swapped = True
+        elapsed = time.perf_counter() - started
         
-        if transactions_data:
-            await db.transactions.insert_many(transactions_data)
+        # Update statistics for the customers covered by this upload
+        customers_updated = 0
+        feature_derivation = None
+        counters_touched = True
+        if transactions_created:
+            with timing_span("upload_transactions.statistics"):
+                customers_updated = await update_customer_statistics(delta, reset=(mode == "replace"))
+            with timing_span("upload_transactions.rollups"):
+                await write_rollups(rollups, reset=(mode == "replace"))
+            if derive_features:
+                with timing_span("upload_transactions.derive_features"):
+                    feature_derivation = await derive_customer_features(list(delta), source=db)
+        elif mode == "replace" and chunks:
+            # A header without rows replaces the transactions with none at all
+            customers_updated = await update_customer_statistics({}, reset=True)
+            await db.transaction_rollups.delete_many({})
         
-        # Update customer statistics
-        await update_customer_statistics()
+        if mode == "replace" and chunks:
+            await update_dashboard_summary({"total_transactions": transactions_created})
+        elif transactions_created:
+            await update_dashboard_summary(inc_fields={"total_transactions": transactions_created})
         
         return {
             "message": "Transactions uploaded successfully",
-            "transactions_created": len(transactions_data)
+            "transactions_created": transactions_created,
+            "customers_updated": customers_updated,
+            "feature_derivation": feature_derivation,
+            "chunks": chunks,
+            "format": upload_format,
+            "ingest_seconds": round(elapsed, 3),
+            "rows_per_second": round(transactions_created / elapsed, 1) if elapsed > 0 else None
         }
     except Exception as e:
+        if pending_insert is not None:
+            # Cancelling would not stop an insert already sent, so let it land before cleaning up
+            await asyncio.gather(pending_insert, return_exceptions=True)
+        if mode == "replace" and not swapped:
+            # The live transactions were never touched
+            await db[f"transactions{STAGING_SUFFIX}"].drop()
+        elif mode == "append" and chunks:
+            await db.transactions.delete_many({"upload_id": upload_id})
+        if swapped or counters_touched:
+            # Statistics and rollups may be half-updated; recompute them from what is stored
+            try:
+                await recompute_transaction_aggregates(None if swapped else list(delta))
+                if derive_features and not swapped:
+                    await derive_customer_features(list(delta), source=db)
+            except Exception:
+                # Keep the upload's own error; POST /admin/migrations/transaction-dates rebuilds the rollups later
+                logger.exception("Could not rebuild statistics after a failed transaction upload")
+        if swapped:
+            raise HTTPException(status_code=500, detail=f"Transactions were replaced, but updating statistics failed: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
 
-async def update_customer_statistics():
-    """Update customer statistics based on transactions"""
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
+async def recompute_transaction_aggregates(customer_ids: Optional[List[str]] = None):
+    """Recompute customer statistics, rollups and the summary from the stored transactions
     
-    for customer in customers:
-        customer_id = customer['id']
-        transactions = await db.transactions.find(
-            {"customer_id": customer_id},
-            {"_id": 0}
-        ).to_list(1000)
-        
-        if transactions:
-            total_transactions = len(transactions)
-            avg_transaction_value = sum(t['amount'] for t in transactions) / total_transactions
-            
-            category_counts = {}
-            for t in transactions:
-                cat = t['merchant_category']
-                category_counts[cat] = category_counts.get(cat, 0) + 1
-            top_category = max(category_counts, key=category_counts.get) if category_counts else ""
-            
-            await db.customers.update_one(
-                {"id": customer_id},
-                {"$set": {
-                    "total_transactions": total_transactions,
-                    "avg_transaction_value": float(avg_transaction_value),
-                    "top_merchant_category": top_category
-                }}
-            )
+    Without customer_ids every customer's statistics are recomputed.
+    """
+    totals = await aggregate_transaction_totals(customer_ids)
+    reset_query = {} if customer_ids is None else {"id": {"$in": customer_ids}}
+    await db.customers.update_many(reset_query, {"$set": transaction_stats_update(0, 0.0, "", 0.0, {})})
+    await set_customer_statistics(totals)
+    await rebuild_rollups()
+    await refresh_dashboard_summary()
+
+def transaction_increments(delta: Dict[str, Dict[str, Any]]) -> List[UpdateOne]:
+    """Build updates that $inc a delta of running totals into the stored counters"""
+    operations = []
+    for customer_id, entry in delta.items():
+        counts = entry["merchant_category_counts"]
+        increments = {f"merchant_category_counts.{category}": count for category, count in counts.items()}
+        increments["total_transactions"] = sum(counts.values())
+        increments["total_transaction_amount"] = entry["total_transaction_amount"]
+        operations.append(UpdateOne({"id": customer_id}, {"$inc": increments}))
+    return operations
+
+def derived_statistics_updates(customers: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """Recompute average value and top category from customers' stored counters
+    
+    Each update only applies while total_transactions is still the value read:
+    otherwise a later append has incremented the customer and sets them itself.
+    """
+    totals = {
+        customer['id']: {
+            "total_transaction_amount": customer.get('total_transaction_amount', 0.0),
+            "merchant_category_counts": customer.get('merchant_category_counts') or {}
+        }
+        for customer in customers
+    }
+    stored_totals = {customer['id']: customer.get('total_transactions', 0) for customer in customers}
+    stats = transaction_features(totals)
+    return [
+        UpdateOne(
+            {"id": customer_id, "total_transactions": stored_totals[customer_id]},
+            {"$set": {"avg_transaction_value": float(avg_value), "top_merchant_category": top_category}}
+        )
+        for customer_id, avg_value, top_category in zip(
+            stats['id'].tolist(), stats['avg_transaction_value'].tolist(), stats['top_merchant_category'].tolist()
+        )
+    ]
+
+async def update_customer_statistics(delta: Dict[str, Dict[str, Any]], reset: bool = False) -> int:
+    """Update the statistics of the customers covered by a delta (see summarize_transactions)
+    
+    With reset the transactions were just replaced, so every customer starts
+    from zero and the delta is written as is. Otherwise its counts and sums
+    are $inc'ed into the stored counters, so concurrent appends for the same
+    customer add up, and the derived fields are recomputed from the updated
+    documents. Returns how many customers matched.
+    """
+    if reset:
+        await db.customers.update_many({}, {"$set": transaction_stats_update(0, 0.0, "", 0.0, {})})
+        return await set_customer_statistics(delta)
+    
+    # Customers stored before running counters existed, and categories that cannot be
+    # used in a field path, are recomputed from their transactions, which include this upload
+    legacy = await db.customers.find(
+        {"id": {"$in": list(delta)}, "total_transactions": {"$gt": 0}, "merchant_category_counts": {"$exists": False}},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    recompute = {c['id'] for c in legacy}
+    recompute.update(
+        customer_id for customer_id, entry in delta.items()
+        if any('.' in category or category.startswith('$') for category in entry["merchant_category_counts"])
+    )
+    matched = await set_customer_statistics(await aggregate_transaction_totals(list(recompute))) if recompute else 0
+    
+    increments = {customer_id: entry for customer_id, entry in delta.items() if customer_id not in recompute}
+    operations = await run_in_threadpool(transaction_increments, increments)
+    # Transactions may reference customers that do not exist; only matched documents count
+    matched += (await bulk_write_batches(db.customers, operations))["matched_count"]
+    
+    updated = await db.customers.find(
+        {"id": {"$in": list(increments)}},
+        {"_id": 0, "id": 1, "total_transactions": 1, "total_transaction_amount": 1, "merchant_category_counts": 1}
+    ).to_list(None)
+    await bulk_write_batches(db.customers, await run_in_threadpool(derived_statistics_updates, updated))
+    return matched
+
+def statistics_updates(totals: Dict[str, Dict[str, Any]]) -> List[UpdateOne]:
+    """Build updates that set customers' statistics from running totals"""
+    stats = transaction_features(totals)
+    columns = ['id'] + TRANSACTION_FEATURE_COLUMNS + TRANSACTION_COUNTER_COLUMNS
+    return [
+        UpdateOne({"id": customer_id}, {"$set": transaction_stats_update(*values)})
+        for customer_id, *values in zip(*(stats[col].tolist() for col in columns))
+    ]
+
+async def set_customer_statistics(totals: Dict[str, Dict[str, Any]]) -> int:
+    """Write statistics derived from running totals, returning how many customers matched"""
+    operations = await run_in_threadpool(statistics_updates, totals)
+    # Transactions may reference customers that do not exist; only matched documents count
+    return (await bulk_write_batches(db.customers, operations))["matched_count"]
 
 @api_router.get("/data/download-template/{template_type}")
 async def download_template(template_type: str):
     """Generate CSV template for download"""
     if template_type == "customers":
         return {
-            "columns": ["company_name", "monthly_spend", "spend_volatility", "international_ratio", "payment_timeliness_score"],
+            "columns": ["customer_id", "company_name", "monthly_spend", "spend_volatility", "international_ratio", "payment_timeliness_score"],
             "sample_data": [
-                ["Acme Corp", 50000, 0.3, 0.4, 0.9],
-                ["TechStart Inc", 30000, 0.5, 0.2, 0.85]
+                ["cust-001", "Acme Corp", 50000, 0.3, 0.4, 0.9],
+                ["cust-002", "TechStart Inc", 30000, 0.5, 0.2, 0.85]
             ],
             "description": {
+                "customer_id": "Optional id that transactions refer to (generated when omitted)",
                 "company_name": "Company name (text)",
                 "monthly_spend": "Average monthly spend in dollars (number)",
                 "spend_volatility": "Spend volatility 0-1 (0.1 = low, 0.8 = high)",
@@ -415,15 +1942,72 @@ async def download_template(template_type: str):
     else:
         raise HTTPException(status_code=404, detail="Template not found")
 
+def keyset_query(query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+    """Restrict a query to documents after a pagination cursor"""
+    if not cursor:
+        return query
+    try:
+        return {**query, "_id": {"$gt": ObjectId(cursor)}}
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate(collection, query: Dict[str, Any], limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    """Fetch one keyset page ordered by _id, with the cursor for the next page"""
+    docs = await collection.find(keyset_query(query, cursor)).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = str(docs[-1]["_id"]) if has_more else None
+    for doc in docs:
+        del doc["_id"]
+    return {"items": docs, "next_cursor": next_cursor}
+
+def json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def stream_ndjson(collection, query: Dict[str, Any], cursor: Optional[str], limit: Optional[int]) -> StreamingResponse:
+    """Stream matching documents as newline-delimited JSON as the cursor yields them"""
+    find = collection.find(keyset_query(query, cursor), {"_id": 0}).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+    if limit:
+        find = find.limit(limit)
+    
+    async def generate():
+        async for doc in find:
+            yield orjson.dumps(doc, default=json_default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @api_router.get("/customers")
-async def get_customers(segment: Optional[str] = None):
-    """Get all customers with optional segment filter"""
+async def get_customers(
+    segment: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    """Get customers with optional segment filter
+    
+    Pass limit and/or cursor for a page with a next_cursor token, or
+    stream=true for newline-delimited JSON. Without either the first
+    DEFAULT_LIST_LIMIT customers come back as a plain list, with an
+    X-Next-Cursor header when there are more.
+    """
     query = {}
     if segment:
         query["segment"] = segment
     
-    customers = await db.customers.find(query, {"_id": 0}).to_list(1000)
-    return customers
+    if stream:
+        return stream_ndjson(db.customers, query, cursor, limit)
+    if limit or cursor:
+        return APIResponse(await cached_response(
+            "customers", {"segment": segment, "limit": limit, "cursor": cursor},
+            lambda: paginate(db.customers, query, limit or DEFAULT_PAGE_SIZE, cursor)
+        ))
+    
+    page = await cached_response(
+        "customers", {"segment": segment, "limit": DEFAULT_LIST_LIMIT, "cursor": None},
+        lambda: paginate(db.customers, query, DEFAULT_LIST_LIMIT, None)
+    )
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    return APIResponse(page["items"], headers=headers)
 
 @api_router.get("/customers/{customer_id}")
 async def get_customer(customer_id: str):
@@ -441,41 +2025,97 @@ async def get_customer(customer_id: str):
         if isinstance(txn.get('transaction_date'), str):
             txn['transaction_date'] = txn['transaction_date']
     
-    return {
+    return APIResponse({
         "customer": customer,
         "transactions": transactions
-    }
+    })
 
 @api_router.get("/segments")
 async def get_segments():
     """Get all segments with statistics"""
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
-    
-    if not customers or not any(c.get('segment') for c in customers):
-        return []
+    return await cached_response("segments", {}, compute_segments, version_field="segmentation_version")
+
+async def compute_segments():
+    pipeline = [
+        {"$match": {"segment": {"$ne": None}}},
+        {"$group": {
+            "_id": "$segment",
+            "segment_id": {"$first": "$segment_id"},
+            "customer_count": {"$sum": 1},
+            "avg_monthly_spend": {"$avg": "$monthly_spend"},
+            "avg_spend_volatility": {"$avg": "$spend_volatility"},
+            "avg_international_ratio": {"$avg": "$international_ratio"},
+            "avg_payment_timeliness": {"$avg": "$payment_timeliness_score"}
+        }},
+        {"$sort": {"segment_id": 1}}
+    ]
     
-    df = pd.DataFrame(customers)
     segments_data = []
-    
-    for segment_name in df['segment'].dropna().unique():
-        segment_customers = df[df['segment'] == segment_name]
-        
-        segment_info = {
-            "id": int(segment_customers['segment_id'].iloc[0]) if 'segment_id' in segment_customers.columns and not segment_customers['segment_id'].isna().all() else 0,
-            "name": segment_name,
-            "description": get_segment_description(segment_name),
-            "customer_count": len(segment_customers),
-            "avg_monthly_spend": float(segment_customers['monthly_spend'].mean()),
+    async for group in (await analytics_source()).customers.aggregate(pipeline):
+        segments_data.append({
+            "id": int(group['segment_id']) if group.get('segment_id') is not None else 0,
+            "name": group['_id'],
+            "description": get_segment_description(group['_id']),
+            "customer_count": group['customer_count'],
+            "avg_monthly_spend": float(group['avg_monthly_spend']),
             "characteristics": {
-                "avg_spend_volatility": float(segment_customers['spend_volatility'].mean()),
-                "avg_international_ratio": float(segment_customers['international_ratio'].mean()),
-                "avg_payment_timeliness": float(segment_customers['payment_timeliness_score'].mean())
+                "avg_spend_volatility": float(group['avg_spend_volatility']),
+                "avg_international_ratio": float(group['avg_international_ratio']),
+                "avg_payment_timeliness": float(group['avg_payment_timeliness'])
             }
-        }
-        segments_data.append(segment_info)
+        })
     
     return segments_data
 
+@api_router.post("/segments/assign")
+async def assign_segments(request: SegmentAssignRequest):
+    """Score new or changed customers against the current model without refitting
+    
+    Without customer_ids every customer that has no segment yet is assigned.
+    """
+    started = time.perf_counter()
+    model = await get_active_segment_model()
+    if not model:
+        raise HTTPException(status_code=400, detail="No segmentation model yet, run an analysis first")
+    
+    query = {"id": {"$in": request.customer_ids}} if request.customer_ids else {"segment": None}
+    ids, X = await load_segment_features(query)
+    loaded = time.perf_counter()
+    
+    labels = predict_segments(model, X)
+    scored = time.perf_counter()
+    
+    final_names = model_segment_names(model)
+    operations = [
+        UpdateOne(
+            {"id": customer_id},
+            {"$set": {
+                "segment": final_names[segment_id],
+                "segment_id": segment_id,
+                "segment_model_version": model["version"]
+            }}
+        )
+        for customer_id, segment_id in zip(ids, labels.tolist())
+    ]
+    write_stats = await bulk_write_batches(db.customers, operations)
+    if operations:
+        await update_dashboard_summary({"segment_counts": await count_segments()}, inc_fields={"segmentation_version": 1})
+    
+    found = set(ids)
+    return {
+        "message": "Customers assigned to segments",
+        "model_version": model["version"],
+        "customers_assigned": len(ids),
+        "not_found": [cid for cid in (request.customer_ids or []) if cid not in found][:MAX_REPORTED_ERRORS],
+        **write_stats,
+        "timings_ms": {
+            "load": round((loaded - started) * 1000, 2),
+            "score": round((scored - loaded) * 1000, 3),
+            "write": write_stats["write_latency_ms"]
+        },
+        "score_us_per_customer": round((scored - loaded) * 1e6 / len(ids), 3) if ids else None
+    }
+
 def get_segment_description(segment_name: str) -> str:
     descriptions = {
         "High-Growth Corporates": "Fast-growing companies with high spend and expansion potential",
@@ -483,146 +2123,443 @@ def get_segment_description(segment_name: str) -> str:
         "Low-Engagement / At-Risk": "Accounts showing low engagement or payment issues requiring attention",
         "Stable Mature Accounts": "Established accounts with consistent, predictable spending patterns"
     }
-    return descriptions.get(segment_name, "Corporate card customer segment")
+    return descriptions.get(base_segment_name(segment_name), "Corporate card customer segment")
+
+SEGMENT_RECOMMENDATIONS = {
+    "High-Growth Corporates": [
+        {
+            "product_name": "Premium Expense Management Suite",
+            "reason": "Automate expense tracking for your growing team",
+            "priority": "high",
+            "expected_value": "Save 15+ hours/month on expense processing"
+        },
+        {
+            "product_name": "B2B Payment Solutions",
+            "reason": "Streamline vendor payments with better cashflow control",
+            "priority": "high",
+            "expected_value": "Extend payment terms by 30 days"
+        },
+        {
+            "product_name": "Corporate Travel Account",
+            "reason": "Dedicated travel booking platform with corporate rates",
+            "priority": "medium",
+            "expected_value": "Save up to 25% on travel bookings"
+        }
+    ],
+    "Travel-Heavy Corporates": [
+        {
+            "product_name": "Corporate Travel Account",
+            "reason": "Exclusive rates and travel management tools",
+            "priority": "high",
+            "expected_value": "Save $5,000+ annually on travel costs"
+        },
+        {
+            "product_name": "Global Currency Solutions",
+            "reason": "Reduce FX fees on international transactions",
+            "priority": "high",
+            "expected_value": "Cut currency conversion costs by 40%"
+        },
+        {
+            "product_name": "Travel Insurance Package",
+            "reason": "Comprehensive coverage for international business travel",
+            "priority": "medium",
+            "expected_value": "Full coverage for $50/traveler/month"
+        }
+    ],
+    "Low-Engagement / At-Risk": [
+        {
+            "product_name": "Basic Expense Management",
+            "reason": "Simple tools to improve payment tracking",
+            "priority": "medium",
+            "expected_value": "Better visibility into spending patterns"
+        },
+        {
+            "product_name": "Payment Automation",
+            "reason": "Automate recurring payments to improve timeliness",
+            "priority": "high",
+            "expected_value": "Never miss a payment deadline"
+        },
+        {
+            "product_name": "Financial Health Dashboard",
+            "reason": "Monitor and improve your financial metrics",
+            "priority": "medium",
+            "expected_value": "Real-time insights into spending health"
+        }
+    ]
+}
+DEFAULT_RECOMMENDATIONS = [
+    {
+        "product_name": "Advanced Analytics Suite",
+        "reason": "Deep insights into spending patterns and optimization",
+        "priority": "medium",
+        "expected_value": "Identify 10-15% cost savings opportunities"
+    },
+    {
+        "product_name": "B2B Payment Solutions",
+        "reason": "Enhance vendor payment efficiency",
+        "priority": "medium",
+        "expected_value": "Optimize working capital management"
+    },
+    {
+        "product_name": "Expense Management Suite",
+        "reason": "Comprehensive expense tracking and reporting",
+        "priority": "low",
+        "expected_value": "Streamline expense workflows"
+    }
+]
+SEGMENT_RECOMMENDATIONS_JSON = {segment: orjson.dumps(offers) for segment, offers in SEGMENT_RECOMMENDATIONS.items()}
+DEFAULT_RECOMMENDATIONS_JSON = orjson.dumps(DEFAULT_RECOMMENDATIONS)
 
 @api_router.get("/recommendations/{customer_id}")
 async def get_recommendations(customer_id: str):
     """Get beyond-the-card product recommendations"""
-    customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
+    return await cached_response("recommendations", {"customer_id": customer_id}, lambda: compute_recommendations(customer_id))
+
+async def compute_recommendations(customer_id: str):
+    customer = await db.customers.find_one({"id": customer_id}, {"_id": 0, "segment": 1})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    recommendations = []
-    segment = customer.get('segment', '')
+    return SEGMENT_RECOMMENDATIONS.get(base_segment_name(customer.get('segment')), DEFAULT_RECOMMENDATIONS)
+
+@api_router.post("/recommendations/batch")
+async def get_recommendations_batch(request: RecommendationBatchRequest):
+    """Stream recommendations for many customers as newline-delimited JSON
     
-    if segment == "High-Growth Corporates":
-        recommendations = [
-            {
-                "product_name": "Premium Expense Management Suite",
-                "reason": "Automate expense tracking for your growing team",
-                "priority": "high",
-                "expected_value": "Save 15+ hours/month on expense processing"
-            },
-            {
-                "product_name": "B2B Payment Solutions",
-                "reason": "Streamline vendor payments with better cashflow control",
-                "priority": "high",
-                "expected_value": "Extend payment terms by 30 days"
-            },
-            {
-                "product_name": "Corporate Travel Account",
-                "reason": "Dedicated travel booking platform with corporate rates",
-                "priority": "medium",
-                "expected_value": "Save up to 25% on travel bookings"
-            }
-        ]
-    elif segment == "Travel-Heavy Corporates":
-        recommendations = [
-            {
-                "product_name": "Corporate Travel Account",
-                "reason": "Exclusive rates and travel management tools",
-                "priority": "high",
-                "expected_value": "Save $5,000+ annually on travel costs"
-            },
-            {
-                "product_name": "Global Currency Solutions",
-                "reason": "Reduce FX fees on international transactions",
-                "priority": "high",
-                "expected_value": "Cut currency conversion costs by 40%"
-            },
-            {
-                "product_name": "Travel Insurance Package",
-                "reason": "Comprehensive coverage for international business travel",
-                "priority": "medium",
-                "expected_value": "Full coverage for $50/traveler/month"
-            }
-        ]
-    elif segment == "Low-Engagement / At-Risk":
-        recommendations = [
-            {
-                "product_name": "Basic Expense Management",
-                "reason": "Simple tools to improve payment tracking",
-                "priority": "medium",
-                "expected_value": "Better visibility into spending patterns"
-            },
-            {
-                "product_name": "Payment Automation",
-                "reason": "Automate recurring payments to improve timeliness",
-                "priority": "high",
-                "expected_value": "Never miss a payment deadline"
-            },
-            {
-                "product_name": "Financial Health Dashboard",
-                "reason": "Monitor and improve your financial metrics",
-                "priority": "medium",
-                "expected_value": "Real-time insights into spending health"
-            }
-        ]
-    else:
-        recommendations = [
-            {
-                "product_name": "Advanced Analytics Suite",
-                "reason": "Deep insights into spending patterns and optimization",
-                "priority": "medium",
-                "expected_value": "Identify 10-15% cost savings opportunities"
-            },
-            {
-                "product_name": "B2B Payment Solutions",
-                "reason": "Enhance vendor payment efficiency",
-                "priority": "medium",
-                "expected_value": "Optimize working capital management"
-            },
-            {
-                "product_name": "Expense Management Suite",
-                "reason": "Comprehensive expense tracking and reporting",
-                "priority": "low",
-                "expected_value": "Streamline expense workflows"
-            }
-        ]
+    Customers are resolved with $in queries (or a segment filter) and each
+    line carries the precomputed offers for the customer's segment; unknown
+    ids are reported at the end with an error.
+    """
+    if bool(request.customer_ids) == bool(request.segment):
+        raise HTTPException(status_code=400, detail="Provide either customer_ids or segment")
+    
+    async def generate():
+        if request.segment:
+            async for customer in db.customers.find({"segment": request.segment}, {"_id": 0, "id": 1, "segment": 1}).batch_size(STREAM_BATCH_SIZE):
+                yield recommendation_line(customer)
+            return
+        
+        customer_ids = list(dict.fromkeys(request.customer_ids))
+        found = set()
+        for start in range(0, len(customer_ids), RECOMMENDATION_BATCH_SIZE):
+            chunk = customer_ids[start:start + RECOMMENDATION_BATCH_SIZE]
+            async for customer in db.customers.find({"id": {"$in": chunk}}, {"_id": 0, "id": 1, "segment": 1}).batch_size(STREAM_BATCH_SIZE):
+                found.add(customer['id'])
+                yield recommendation_line(customer)
+        for customer_id in customer_ids:
+            if customer_id not in found:
+                yield orjson.dumps({"customer_id": customer_id, "error": "Customer not found"}, option=orjson.OPT_APPEND_NEWLINE)
     
-    return recommendations
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def recommendation_line(customer: Dict[str, Any]) -> bytes:
+    """Render one NDJSON line using the pre-serialized offers for the customer's segment"""
+    segment = customer.get('segment')
+    offers = SEGMENT_RECOMMENDATIONS_JSON.get(base_segment_name(segment), DEFAULT_RECOMMENDATIONS_JSON)
+    return b'{"customer_id":' + orjson.dumps(customer["id"]) + b',"segment":' + orjson.dumps(segment) + b',"recommendations":' + offers + b'}\n'
 
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    """Get dashboard statistics"""
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
-    transactions = await db.transactions.find({}, {"_id": 0}).to_list(10000)
-    
-    total_spend = sum(c.get('monthly_spend', 0) for c in customers)
-    avg_spend = total_spend / len(customers) if customers else 0
+    """Get dashboard statistics from the materialized summary"""
+    return await cached_response("dashboard/stats", {}, compute_dashboard_stats)
+
+async def compute_dashboard_stats():
+    summary = await ensure_dashboard_summary()
     
-    segment_dist = {}
-    for c in customers:
-        seg = c.get('segment', 'Unassigned')
-        segment_dist[seg] = segment_dist.get(seg, 0) + 1
+    total_customers = summary.get('total_customers', 0)
+    total_spend = summary.get('total_spend', 0.0)
+    avg_spend = total_spend / total_customers if total_customers else 0
     
     segment_distribution = [
         {"name": k, "count": v}
-        for k, v in segment_dist.items()
+        for k, v in summary.get('segment_counts', {}).items()
+        if v
     ]
     
     return {
-        "total_customers": len(customers),
+        "total_customers": total_customers,
         "total_spend": round(total_spend, 2),
         "avg_spend_per_customer": round(avg_spend, 2),
-        "total_transactions": len(transactions),
+        "total_transactions": summary.get('total_transactions', 0),
         "segment_distribution": segment_distribution
     }
 
 @api_router.get("/transactions")
-async def get_transactions(customer_id: Optional[str] = None):
-    """Get all transactions, optionally filtered by customer_id"""
+async def get_transactions(
+    customer_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    """Get all transactions, optionally filtered by customer_id and a [start, end) date range
+    
+    Supports the same limit/cursor pagination and stream=true NDJSON mode as
+    /customers.
+    """
     query = {}
     if customer_id:
         query["customer_id"] = customer_id
+    if start or end:
+        query["transaction_date"] = date_range(start, end)
+    
+    if stream:
+        return stream_ndjson(db.transactions, query, cursor, limit)
+    if limit or cursor:
+        return APIResponse(await paginate(db.transactions, query, limit or DEFAULT_PAGE_SIZE, cursor))
     
     transactions = await db.transactions.find(
         query, {"_id": 0}
     ).to_list(10000)
-    return transactions
+    return APIResponse(transactions)
+
+def date_range(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, datetime]:
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return bounds
+
+async def compute_spend_over_time(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Sum rollup buckets per period, with a per-category breakdown"""
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"period": "$period", "merchant_category": "$merchant_category"},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": "$count"}
+        }},
+        {"$sort": {"_id.period": 1}}
+    ]
+    series = {}
+    async for doc in (await analytics_source()).transaction_rollups.aggregate(pipeline):
+        period = doc['_id']['period']
+        point = series.setdefault(period, {"period": period, "total_spend": 0.0, "transactions": 0, "by_category": {}})
+        point["total_spend"] += doc['amount']
+        point["transactions"] += doc['count']
+        point["by_category"][doc['_id']['merchant_category']] = doc['amount']
+    return [series[period] for period in sorted(series)]
+
+def spend_match(granularity: str, start: Optional[datetime], end: Optional[datetime], merchant_category: Optional[str]) -> Dict[str, Any]:
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}")
+    match = {"granularity": granularity}
+    if start or end:
+        match["period"] = date_range(start, end)
+    if merchant_category:
+        match["merchant_category"] = merchant_category
+    return match
+
+@api_router.get("/spend-over-time")
+async def get_spend_over_time(
+    granularity: str = "month",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    merchant_category: Optional[str] = None
+):
+    """Portfolio spend per day or month, answered from the pre-aggregated rollups"""
+    match = spend_match(granularity, start, end, merchant_category)
+    return await cached_response(
+        "spend-over-time", {"granularity": granularity, "start": start, "end": end, "merchant_category": merchant_category},
+        lambda: compute_spend_over_time(match)
+    )
+
+@api_router.get("/customers/{customer_id}/spend-over-time")
+async def get_customer_spend_over_time(
+    customer_id: str,
+    granularity: str = "month",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    merchant_category: Optional[str] = None
+):
+    """One customer's spend per day or month, answered from the pre-aggregated rollups"""
+    match = {"customer_id": customer_id, **spend_match(granularity, start, end, merchant_category)}
+    return await cached_response(
+        "customer-spend-over-time",
+        {"customer_id": customer_id, "granularity": granularity, "start": start, "end": end, "merchant_category": merchant_category},
+        lambda: compute_spend_over_time(match)
+    )
+
+async def migrate_transaction_dates() -> Dict[str, Any]:
+    """Convert ISO string transaction dates to BSON datetimes, then rebuild the rollups"""
+    result = await db.transactions.update_many(
+        {"transaction_date": {"$type": "string"}},
+        [{"$set": {"transaction_date": {"$toDate": "$transaction_date"}}}]
+    )
+    rollups = await rebuild_rollups()
+    await update_dashboard_summary()
+    return {"transactions_converted": result.modified_count, **rollups}
+
+@api_router.post("/admin/migrations/transaction-dates", status_code=202)
+async def migrate_transaction_dates_endpoint():
+    """Migrate data written before dates were stored natively, as a background job"""
+    job = submit_job("migration", migrate_transaction_dates)
+    return {
+        "message": "Migration job submitted",
+        "job_id": job["id"],
+        "status": job["status"]
+    }
+
+INDEXES = {
+    "customers": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("segment", ASCENDING), ("_id", ASCENDING)], name="segment_keyset")
+    ],
+    "transactions": [
+        IndexModel([("customer_id", ASCENDING), ("transaction_date", ASCENDING)], name="customer_date"),
+        IndexModel([("customer_id", ASCENDING), ("_id", ASCENDING)], name="customer_keyset")
+    ],
+    "transaction_rollups": [
+        IndexModel([("customer_id", ASCENDING), ("granularity", ASCENDING), ("period", ASCENDING), ("merchant_category", ASCENDING)], name="rollup_key", unique=True),
+        IndexModel([("granularity", ASCENDING), ("period", ASCENDING)], name="granularity_period")
+    ],
+    "segment_models": [
+        IndexModel([("version", DESCENDING)], name="version_unique", unique=True)
+    ],
+    "response_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0)
+    ]
+}
+
+# Representative filters for the lookups server.py issues, checked by /admin/indexes
+QUERY_SHAPES = [
+    ("customers", "get_customer / get_recommendations", {"id": ""}),
+    ("customers", "get_customers?segment=", {"segment": ""}),
+    ("customers", "segments/assign (unassigned)", {"segment": None}),
+    ("transactions", "get_customer / get_transactions?customer_id=", {"customer_id": ""}),
+    ("transactions", "statistics for a chunk of customers", {"customer_id": {"$in": [""]}}),
+    ("transaction_rollups", "customers/{id}/spend-over-time", {"customer_id": "", "granularity": "month"}),
+    ("transaction_rollups", "spend-over-time", {"granularity": "month", "period": {"$gte": datetime(2000, 1, 1)}}),
+    ("segment_models", "active model", {"version": {"$gte": 0}})
+]
+
+async def ensure_indexes():
+    """Create the declared indexes, logging rather than failing on conflicts"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.warning("Could not ensure indexes on %s: %s", collection, e)
+
+def plan_stages(plan: Dict[str, Any]):
+    """Yield every stage name in an explain plan tree"""
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+@api_router.get("/admin/cache")
+async def get_cache_stats():
+    """Report response cache hit/miss counters and the current data versions"""
+    return {**response_cache.stats(), **(await get_data_versions())}
+
+@api_router.get("/admin/indexes")
+async def get_index_report():
+    """Report declared indexes, their usage, and hot queries that would scan a collection"""
+    collections = {}
+    for collection, indexes in INDEXES.items():
+        declared = [index.document['name'] for index in indexes]
+        existing = await db[collection].index_information()
+        try:
+            usage = {
+                stat['name']: {"ops": stat['accesses']['ops'], "since": stat['accesses']['since']}
+                async for stat in db[collection].aggregate([{"$indexStats": {}}])
+            }
+        except OperationFailure:
+            usage = {}
+        collections[collection] = {
+            "indexes": {name: {"key": info['key'], "usage": usage.get(name)} for name, info in existing.items()},
+            "missing": [name for name in declared if name not in existing]
+        }
+    
+    unindexed_queries = []
+    for collection, used_by, query_filter in QUERY_SHAPES:
+        try:
+            explain = await db.command("explain", {"find": collection, "filter": query_filter}, verbosity="queryPlanner")
+        except OperationFailure as e:
+            unindexed_queries.append({"collection": collection, "used_by": used_by, "error": str(e)})
+            continue
+        winning_plan = explain['queryPlanner']['winningPlan']
+        if "COLLSCAN" in set(plan_stages(winning_plan.get('queryPlan', winning_plan))):
+            unindexed_queries.append({"collection": collection, "used_by": used_by, "filter": str(query_filter)})
+    
+    return {"collections": collections, "unindexed_queries": unindexed_queries}
 
 app.include_router(api_router)
 
+class RequestMetricsMiddleware:
+    """Time every request against its route template rather than the raw path"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], route_template(scope), str(status))
+
+def route_template(scope) -> str:
+    """Route path a request was handled by, matched here for responses that never reached the router (e.g. 304s)"""
+    route = scope.get("route")
+    if route is None:
+        route = next((r for r in app.router.routes if r.matches(scope)[0] == Match.FULL), None)
+    return getattr(route, "path", "unmatched")
+
+# Every write path bumps data_version, so these reads cannot change without the version moving
+ETAG_PATH_PREFIXES = (
+    "/api/customers", "/api/transactions", "/api/segments", "/api/dashboard/stats",
+    "/api/recommendations/", "/api/spend-over-time"
+)
+
+class DataVersionETagMiddleware:
+    """Tag reads with a weak ETag from the data version and answer If-None-Match with 304"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(ETAG_PATH_PREFIXES):
+            return await self.app(scope, receive, send)
+        
+        versions = await get_data_versions()
+        etag = f'W/"{versions["data_version"]}-{zlib.crc32(str(versions["updated_at"]).encode()):08x}"'
+        if_none_match = {tag.strip() for tag in Headers(scope=scope).get("if-none-match", "").split(",")}
+        if etag in if_none_match or "*" in if_none_match:
+            return await Response(status_code=304, headers={"ETag": etag})(scope, receive, send)
+        
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                MutableHeaders(raw=message.setdefault("headers", []))["ETag"] = etag
+            await send(message)
+        
+        await self.app(scope, receive, send_with_etag)
+
+app.add_middleware(DataVersionETagMiddleware)
+# Added after the ETag middleware so it wraps it: 304s and the version read are timed too
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Expose request, MongoDB and span timings in Prometheus text format"""
+    lines = []
+    for metric in (http_request_seconds, mongo_command_seconds, mongo_command_failures, span_seconds):
+        lines += metric.render()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 # Configure CORS - update with your frontend URL
 app.add_middleware(
     CORSMiddleware,
@@ -639,16 +2576,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above COMPRESSION_MIN_SIZE bytes, with brotli when the client accepts it
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("server:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""Local benchmark harness for the Corporate Card Analytics API hot paths.
+
+Runs the FastAPI app in-process against a local MongoDB (MONGO_URL from
+backend/.env, separate database) or, with --mock, an in-memory mongomock
+stand-in (pip install mongomock-motor; only practical for small sizes).
+For each dataset size it seeds a reproducible portfolio and records latency
+percentiles and throughput, then writes everything to a JSON file that can be
+compared against a previous run with --compare.
+
+    python backend_benchmark.py --sizes 1000 100000 1000000
+    python backend_benchmark.py --mock --sizes 1000 --output before.json
+    python backend_benchmark.py --mock --sizes 1000 --compare before.json
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+REGRESSION_THRESHOLD = 1.2
+
+
+def summarize(latencies_ms, elapsed_s):
+    """Latency percentiles (ms) and sequential throughput for one endpoint"""
+    values = np.asarray(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "throughput_per_s": round(len(values) / elapsed_s, 2) if elapsed_s > 0 else None
+    }
+
+
+class CorporateCardAPIBenchmark:
+    def __init__(self, client, requests=200, repeat=3, seed=42, transactions_per_customer=10):
+        self.client = client
+        self.requests = requests
+        self.repeat = repeat
+        self.seed = seed
+        self.transactions_per_customer = transactions_per_customer
+        self.rng = np.random.default_rng(seed)
+
+    def call(self, method, url, **kwargs):
+        """Issue one request, returning its latency in ms and the response"""
+        started = time.perf_counter()
+        response = self.client.request(method, f"/api/{url}", **kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} /api/{url} failed with {response.status_code}: {response.text[:200]}")
+        return latency_ms, response
+
+    def measure(self, name, method, urls, **kwargs):
+        """Time a sequence of requests and summarize them"""
+        latencies = []
+        started = time.perf_counter()
+        for url in urls:
+            latency_ms, _ = self.call(method, url, **kwargs)
+            latencies.append(latency_ms)
+        result = summarize(latencies, time.perf_counter() - started)
+        print(f"   {name:<28} p50 {result['p50_ms']:>10.2f} ms   p99 {result['p99_ms']:>10.2f} ms   {result['throughput_per_s']} req/s")
+        return result
+
+    def seed_dataset(self, rows):
+        customers = max(4, rows // self.transactions_per_customer)
+        latency_ms, response = self.call("POST", "data/seed", params={
+            "customers": customers,
+            "transactions_per_customer": self.transactions_per_customer,
+            "seed": self.seed
+        })
+        data = response.json()
+        print(f"   seeded {data['customers_created']} customers / {data['transactions_created']} transactions in {latency_ms / 1000:.1f}s")
+        return {
+            "customers": data["customers_created"],
+            "transactions": data["transactions_created"],
+            "seed_ms": round(latency_ms, 3),
+            "generation_rows_per_s": data.get("transactions_per_second")
+        }
+
+    def bench_segmentation(self):
+        """Run analysis jobs back to back, timing each until it completes"""
+        latencies = []
+        server_ms = []
+        started = time.perf_counter()
+        for _ in range(self.repeat):
+            job_started = time.perf_counter()
+            _, response = self.call("POST", "analyze")
+            job_id = response.json()["job_id"]
+            while True:
+                _, response = self.call("GET", f"jobs/{job_id}")
+                job = response.json()
+                if job["status"] in ("completed", "failed"):
+                    break
+                time.sleep(0.02)
+            if job["status"] == "failed":
+                raise RuntimeError(f"Segmentation job failed: {job['error']}")
+            latencies.append((time.perf_counter() - job_started) * 1000)
+            server_ms.append(job["result"]["timings_ms"])
+        result = summarize(latencies, time.perf_counter() - started)
+        result["stages_ms"] = {stage: round(float(np.mean([t[stage] for t in server_ms])), 3) for stage in server_ms[0]}
+        print(f"   {'run_segmentation':<28} p50 {result['p50_ms']:>10.2f} ms   stages {result['stages_ms']}")
+        return result
+
+    def export_csv(self, url, columns):
+        _, response = self.call("GET", url, params={"stream": "true"})
+        frame = pd.read_json(io.StringIO(response.text), lines=True)
+        return frame[columns].to_csv(index=False).encode("utf-8")
+
+    def bench_upload(self, name, url, filename, payload):
+        latencies = []
+        rows_per_s = []
+        started = time.perf_counter()
+        for _ in range(self.repeat):
+            latency_ms, response = self.call("POST", url, files={"file": (filename, payload, "text/csv")})
+            latencies.append(latency_ms)
+            rows_per_s.append(response.json().get("rows_per_second"))
+        result = summarize(latencies, time.perf_counter() - started)
+        result["payload_bytes"] = len(payload)
+        if any(rows_per_s):
+            result["rows_per_second"] = round(float(np.mean([r for r in rows_per_s if r])), 1)
+        print(f"   {name:<28} p50 {result['p50_ms']:>10.2f} ms   {len(payload) / 1e6:.1f} MB")
+        return result
+
+    def run_size(self, rows):
+        print(f"\n📊 DATASET ~{rows} transactions")
+        print("-" * 60)
+        dataset = self.seed_dataset(rows)
+        results = {}
+
+        results["run_segmentation"] = self.bench_segmentation()
+        results["dashboard_stats"] = self.measure("GET /dashboard/stats", "GET", ["dashboard/stats"] * self.requests)
+        results["segments"] = self.measure("GET /segments", "GET", ["segments"] * self.requests)
+
+        _, response = self.call("GET", "customers", params={"limit": min(dataset["customers"], 5000)})
+        ids = [c["id"] for c in response.json()["items"]]
+        sample = self.rng.choice(ids, size=self.requests)
+        results["customer_detail"] = self.measure("GET /customers/{id}", "GET", [f"customers/{cid}" for cid in sample])
+
+        transactions_csv = self.export_csv("transactions", server.TRANSACTION_COLUMNS)
+        customers_csv = self.export_csv("customers", server.CUSTOMER_COLUMNS)
+        results["upload_transactions"] = self.bench_upload("POST upload-transactions", "data/upload-transactions", "transactions.csv", transactions_csv)
+        results["upload_customers"] = self.bench_upload("POST upload-customers", "data/upload-customers", "customers.csv", customers_csv)
+
+        return {"dataset": dataset, "endpoints": results}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print p50 changes per endpoint against a previous results file"""
+    print("\n📈 COMPARISON (p50) against", previous["meta"].get("commit"))
+    print("-" * 60)
+    regressions = 0
+    for size, run in current["results"].items():
+        old_run = previous["results"].get(size)
+        if not old_run:
+            continue
+        for endpoint, result in run["endpoints"].items():
+            old = old_run["endpoints"].get(endpoint)
+            if not old:
+                continue
+            ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+            flag = "⚠️ " if ratio > REGRESSION_THRESHOLD else "  "
+            regressions += ratio > REGRESSION_THRESHOLD
+            print(f"{flag}{size:>8} {endpoint:<22} {old['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} ms  ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="dataset sizes in transactions")
+    parser.add_argument("--requests", type=int, default=200, help="requests per read endpoint")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of segmentation and each upload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--transactions-per-customer", type=int, default=10)
+    parser.add_argument("--db-name", default="corporate_card_benchmark", help="database used on the local MongoDB")
+    parser.add_argument("--mock", action="store_true", help="use an in-memory mongomock database instead of MongoDB")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache for read endpoints")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    if args.mock:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            print("--mock needs mongomock-motor: pip install mongomock-motor")
+            return 2
+        server.db = server.analytics_db = AsyncMongoMockClient()[args.db_name]
+    else:
+        server.open_mongo_clients()
+        server.db = server.client[args.db_name]
+        server.analytics_db = server.analytics_client[args.db_name]
+    if args.no_cache:
+        server.response_cache.max_entries = 0
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print("🚀 Starting Corporate Card Analytics API Benchmark")
+    print("=" * 60)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongomock" if args.mock else "mongodb",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "transactions_per_customer": args.transactions_per_customer,
+            "response_cache": not args.no_cache
+        },
+        "results": {}
+    }
+
+    with TestClient(server.app) as client:
+        benchmark = CorporateCardAPIBenchmark(client, args.requests, args.repeat, args.seed, args.transactions_per_customer)
+        for rows in args.sizes:
+            report["results"][str(rows)] = benchmark.run_size(rows)
+        if not args.mock:
+            client.portal.call(server.client.drop_database, args.db_name)
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), report)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -83,9 +83,12 @@ class CorporateCardAnalyticsAPITester:
 
     def test_run_analysis(self):
         """Test segmentation analysis"""
-        success, response = self.run_test("Run Analysis", "POST", "analyze", 200)
+        success, response = self.run_test("Run Analysis", "POST", "analyze", 202)
         if success:
-            print(f"   Created {response.get('segments_created', 0)} segments")
+            print(f"   Submitted job {response.get('job_id', 'N/A')}")
+            job_success, job = self.run_test("Get Analysis Job", "GET", f"jobs/{response.get('job_id')}", 200)
+            if job_success:
+                print(f"   Job status: {job.get('status', 'N/A')}")
         return success, response
 
     def test_get_customers(self):
@@ -6,32 +6,56 @@ import { toast } from "sonner";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const PAGE_SIZE = 500;
 
 const Customers = () => {
   const [customers, setCustomers] = useState([]);
   const [filteredCustomers, setFilteredCustomers] = useState([]);
+  const [segments, setSegments] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState("");
   const [selectedSegment, setSelectedSegment] = useState("all");
   const navigate = useNavigate();
 
   useEffect(() => {
-    fetchCustomers();
+    fetchSegments();
   }, []);
 
+  useEffect(() => {
+    fetchCustomers();
+  }, [selectedSegment]);
+
   useEffect(() => {
     filterCustomers();
-  }, [customers, searchTerm, selectedSegment]);
+  }, [customers, searchTerm]);
+
+  const fetchSegments = async () => {
+    try {
+      const response = await axios.get(`${API}/segments`);
+      setSegments(response.data.map((s) => s.name));
+    } catch (error) {
+      console.error(error);
+    }
+  };
 
-  const fetchCustomers = async () => {
+  // Customers are loaded a page at a time; the segment filter is applied by the server
+  const fetchCustomers = async (cursor = null) => {
+    const params = { limit: PAGE_SIZE };
+    if (cursor) params.cursor = cursor;
+    if (selectedSegment !== "all") params.segment = selectedSegment;
+    if (cursor) setLoadingMore(true);
     try {
-      const response = await axios.get(`${API}/customers`);
-      setCustomers(response.data);
+      const response = await axios.get(`${API}/customers`, { params });
+      setCustomers((previous) => (cursor ? [...previous, ...response.data.items] : response.data.items));
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error("Failed to load customers");
       console.error(error);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -44,10 +68,6 @@ const Customers = () => {
       );
     }
 
-    if (selectedSegment !== "all") {
-      filtered = filtered.filter((c) => c.segment === selectedSegment);
-    }
-
     setFilteredCustomers(filtered);
   };
 
@@ -59,8 +79,6 @@ const Customers = () => {
     return "bg-purple-100 text-purple-700";
   };
 
-  const uniqueSegments = [...new Set(customers.map((c) => c.segment).filter(Boolean))];
-
   if (loading) {
     return (
       <div className="flex items-center justify-center h-full">
@@ -98,7 +116,7 @@ const Customers = () => {
             className="px-4 py-2 border border-slate-200 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500"
           >
             <option value="all">All Segments</option>
-            {uniqueSegments.map((seg) => (
+            {segments.map((seg) => (
               <option key={seg} value={seg}>
                 {seg}
               </option>
@@ -181,6 +199,19 @@ const Customers = () => {
             <p>No customers found</p>
           </div>
         )}
+
+        {nextCursor && (
+          <div className="p-4 text-center border-t border-slate-200">
+            <button
+              data-testid="load-more-customers"
+              onClick={() => fetchCustomers(nextCursor)}
+              disabled={loadingMore}
+              className="text-blue-600 hover:text-blue-700 font-medium text-sm disabled:text-slate-400"
+            >
+              {loadingMore ? "Loading..." : "Load more customers"}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -5,6 +5,7 @@ import { toast } from "sonner";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const JOB_POLL_INTERVAL_MS = 1000;
 
 const DataManagement = () => {
   const [seedingData, setSeedingData] = useState(false);
@@ -35,7 +36,16 @@ const DataManagement = () => {
     setAnalysisResult(null);
     try {
       const response = await axios.post(`${API}/analyze`);
-      setAnalysisResult(response.data);
+      let job = response.data;
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        job = (await axios.get(`${API}/jobs/${response.data.job_id}`)).data;
+      }
+      if (job.status === "failed") {
+        toast.error(job.error || "Failed to run analysis");
+        return;
+      }
+      setAnalysisResult(job.result);
       toast.success("Segmentation analysis completed successfully");
     } catch (error) {
       toast.error(error.response?.data?.detail || "Failed to run analysis");
@@ -60,6 +70,9 @@ const DataManagement = () => {
       });
       setUploadResult(response.data);
       toast.success(`Uploaded ${response.data.customers_created} customers`);
+      if (response.data.rows_rejected) {
+        toast.warning(`${response.data.rows_rejected} rows were rejected, see the upload report`);
+      }
     } catch (error) {
       toast.error(error.response?.data?.detail || "Failed to upload customers");
       console.error(error);
@@ -135,7 +148,7 @@ const DataManagement = () => {
             </div>
             <div>
               <h2 className="text-xl font-bold text-slate-900">Upload Your Data</h2>
-              <p className="text-sm text-slate-600">Import customers and transactions from CSV</p>
+              <p className="text-sm text-slate-600">Import customers and transactions from CSV, Parquet or Arrow</p>
             </div>
           </div>
 
@@ -155,7 +168,7 @@ const DataManagement = () => {
               <label className="block">
                 <input
                   type="file"
-                  accept=".csv"
+                  accept=".csv,.parquet,.arrow,.feather"
                   onChange={handleUploadCustomers}
                   data-testid="upload-customers-input"
                   disabled={uploadingCustomers}
@@ -198,7 +211,7 @@ const DataManagement = () => {
               <label className="block">
                 <input
                   type="file"
-                  accept=".csv"
+                  accept=".csv,.parquet,.arrow,.feather"
                   onChange={handleUploadTransactions}
                   data-testid="upload-transactions-input"
                   disabled={uploadingTransactions}
@@ -234,6 +247,16 @@ const DataManagement = () => {
                   <p className="text-emerald-700">
                     {uploadResult.customers_created && `${uploadResult.customers_created} customers uploaded`}
                   </p>
+                  {uploadResult.rows_rejected > 0 && (
+                    <div className="mt-2 text-amber-700">
+                      <p>{uploadResult.rows_rejected} rows rejected:</p>
+                      <ul className="list-disc list-inside">
+                        {uploadResult.errors.map((error) => (
+                          <li key={error.row}>Row {error.row}: {error.errors.join(", ")}</li>
+                        ))}
+                      </ul>
+                    </div>
+                  )}
                 </div>
               </div>
             )}
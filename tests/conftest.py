@@ -0,0 +1,30 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+# Keep the feature snapshot off disk while tests run
+os.environ["FEATURE_SNAPSHOT_DIR"] = ""
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """Point the server's database handles at an in-memory mongomock database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    database = mongomock_motor.AsyncMongoMockClient()["test_database"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "analytics_db", database)
+    # Every mock database starts at data_version 0, so cached responses must not outlive a test
+    monkeypatch.setattr(server, "response_cache", server.ResponseCache(server.RESPONSE_CACHE_SIZE, server.RESPONSE_CACHE_TTL))
+    return database
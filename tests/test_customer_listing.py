@@ -0,0 +1,31 @@
+import orjson
+import pytest
+
+import server
+
+
+async def list_customers(**params):
+    return await server.get_customers(**{"segment": None, "limit": None, "cursor": None, "stream": False, **params})
+
+
+@pytest.mark.anyio
+async def test_unpaginated_list_is_bounded_with_a_next_cursor(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "DEFAULT_LIST_LIMIT", 3)
+    await mock_db.customers.insert_many([{"id": f"C{i}", "segment": "A" if i % 2 else "B"} for i in range(5)])
+
+    response = await list_customers()
+
+    assert [c["id"] for c in orjson.loads(response.body)] == ["C0", "C1", "C2"]
+    page = orjson.loads((await list_customers(cursor=response.headers["x-next-cursor"])).body)
+    assert [c["id"] for c in page["items"]] == ["C3", "C4"]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_short_list_has_no_next_cursor(mock_db):
+    await mock_db.customers.insert_many([{"id": f"C{i}", "segment": "A" if i % 2 else "B"} for i in range(5)])
+
+    response = await list_customers(segment="A")
+
+    assert [c["id"] for c in orjson.loads(response.body)] == ["C1", "C3"]
+    assert "x-next-cursor" not in response.headers
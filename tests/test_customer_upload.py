@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+import server
+
+HEADER = "customer_id,company_name,monthly_spend,spend_volatility,international_ratio,payment_timeliness_score\n"
+
+
+def csv_upload(*rows):
+    return UploadFile(io.BytesIO((HEADER + "".join(f"{row}\n" for row in rows)).encode()), filename="customers.csv")
+
+
+@pytest.mark.anyio
+async def test_replace_with_too_few_customers_keeps_the_live_ones(mock_db):
+    await mock_db.customers.insert_many([{"id": f"OLD{i}", "segment": "Stable Mature Accounts"} for i in range(5)])
+    rows = [f"C{i},Company {i},5000,0.2,0.1,0.9" for i in range(3)] + ["C9,Broken,-1,0.2,0.1,0.9"]
+
+    with pytest.raises(HTTPException) as raised:
+        await server.upload_customers(csv_upload(*rows), mode="replace")
+
+    assert raised.value.status_code == 400
+    assert "3 valid rows" in raised.value.detail
+    assert sorted(await mock_db.customers.distinct("id")) == [f"OLD{i}" for i in range(5)]
+    assert "customers_staging" not in await mock_db.list_collection_names()
+
+
+@pytest.mark.anyio
+async def test_replace_loads_and_segments_the_customers(mock_db):
+    await mock_db.customers.insert_one({"id": "OLD0"})
+    rows = [f"C{i},Company {i},{5000 * (i + 1)},0.2,{0.1 * (i % 3)},0.9" for i in range(6)]
+
+    result = await server.upload_customers(csv_upload(*rows), mode="replace")
+
+    assert result["customers_created"] == 6
+    assert sorted(await mock_db.customers.distinct("id")) == [f"C{i}" for i in range(6)]
+    assert await mock_db.customers.count_documents({"segment": None}) == 0
+
+
+@pytest.mark.anyio
+async def test_staging_carries_the_indexes_and_swaps_in_whole(mock_db):
+    await mock_db.customers.insert_one({"id": "OLD0"})
+
+    staging = await server.create_staging("customers")
+    await staging.insert_many([{"id": "C1"}, {"id": "C2"}])
+    assert "id_unique" in await staging.index_information()
+    assert await mock_db.customers.distinct("id") == ["OLD0"]
+
+    await server.swap_in_staging("customers")
+
+    assert sorted(await mock_db.customers.distinct("id")) == ["C1", "C2"]
+    assert "customers_staging" not in await mock_db.list_collection_names()
+
+
+@pytest.mark.anyio
+async def test_upsert_updates_by_id_and_scores_against_the_current_model(mock_db):
+    rows = [f"C{i},Company {i},{5000 * (i + 1)},0.2,{0.1 * (i % 3)},0.9" for i in range(6)]
+    await server.upload_customers(csv_upload(*rows), mode="replace")
+    await mock_db.transactions.insert_one({"customer_id": "C1", "merchant_category": "Travel", "amount": 70.0})
+    model = await server.get_active_segment_model()
+
+    result = await server.upload_customers(
+        csv_upload("C1,Renamed Co,6000,0.2,0.1,0.9", "C9,Newco,900000,0.2,0.1,0.9"), mode="upsert"
+    )
+
+    assert result["customers_upserted"] == 2
+    assert result["segmentation"]["model_version"] == model["version"]
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert (c1["company_name"], c1["monthly_spend"], c1["total_transactions"]) == ("Renamed Co", 6000.0, 1)
+    c9 = await mock_db.customers.find_one({"id": "C9"}, {"_id": 0})
+    assert c9["total_transactions"] == 0
+    assert c9["segment_model_version"] == model["version"]
+    assert c9["segment"] in server.model_segment_names(model).values()
+    assert await mock_db.customers.count_documents({}) == 7
@@ -0,0 +1,79 @@
+import pandas as pd
+
+import server
+
+
+def customer_row(**overrides):
+    row = {
+        "customer_id": "C1",
+        "company_name": "Acme Corp",
+        "monthly_spend": 5000,
+        "spend_volatility": 0.2,
+        "international_ratio": 0.1,
+        "payment_timeliness_score": 0.9,
+    }
+    row.update(overrides)
+    return row
+
+
+def test_valid_rows_are_coerced():
+    df = pd.DataFrame([customer_row(company_name="  Acme Corp  ", monthly_spend="5000.5")])
+
+    valid, invalid_count, errors = server.validate_customer_frame(df)
+
+    assert invalid_count == 0
+    assert errors == []
+    assert valid.iloc[0]["company_name"] == "Acme Corp"
+    assert valid.iloc[0]["monthly_spend"] == 5000.5
+
+
+def test_invalid_rows_are_rejected_with_every_problem():
+    df = pd.DataFrame([
+        customer_row(),
+        customer_row(customer_id="C2", company_name="", monthly_spend=-1),
+        customer_row(customer_id="C3", spend_volatility="high", international_ratio=1.5),
+        customer_row(customer_id="C4", monthly_spend=float("inf")),
+    ])
+
+    valid, invalid_count, errors = server.validate_customer_frame(df)
+
+    assert valid["customer_id"].tolist() == ["C1"]
+    assert invalid_count == 3
+    assert errors == [
+        {"row": 3, "errors": ["company_name: missing", "monthly_spend: must not be negative"]},
+        {"row": 4, "errors": ["spend_volatility: not a number", "international_ratio: must be between 0 and 1"]},
+        {"row": 5, "errors": ["monthly_spend: not a number"]},
+    ]
+
+
+def test_duplicate_customer_ids_keep_the_first_row():
+    df = pd.DataFrame([customer_row(), customer_row(company_name="Acme Again"), customer_row(customer_id=" ")])
+
+    valid, invalid_count, errors = server.validate_customer_frame(df)
+
+    assert valid["company_name"].tolist() == ["Acme Corp"]
+    assert invalid_count == 2
+    assert errors == [
+        {"row": 3, "errors": ["customer_id: duplicate of an earlier row"]},
+        {"row": 4, "errors": ["customer_id: missing"]},
+    ]
+
+
+def test_rows_are_numbered_from_first_row():
+    df = pd.DataFrame([customer_row(), customer_row(customer_id="C2", payment_timeliness_score=-0.1)])
+
+    _, _, csv_errors = server.validate_customer_frame(df)
+    _, _, columnar_errors = server.validate_customer_frame(df, first_row=1)
+
+    assert [e["row"] for e in csv_errors] == [3]
+    assert [e["row"] for e in columnar_errors] == [2]
+
+
+def test_error_report_is_capped():
+    df = pd.DataFrame([customer_row(customer_id=f"C{i}", company_name="") for i in range(server.MAX_REPORTED_ERRORS + 5)])
+
+    valid, invalid_count, errors = server.validate_customer_frame(df)
+
+    assert valid.empty
+    assert invalid_count == server.MAX_REPORTED_ERRORS + 5
+    assert len(errors) == server.MAX_REPORTED_ERRORS
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+
+
+def monthly_rows(rows):
+    monthly = pd.DataFrame(rows, columns=['customer_id', 'period', 'amount', 'count', 'international_count'])
+    monthly['period'] = pd.to_datetime(monthly['period'])
+    return monthly
+
+
+def features_by_id(monthly):
+    features = server.compute_derived_features(monthly)
+    assert list(features.columns) == ['id'] + server.DERIVED_FEATURE_COLUMNS
+    return features.set_index('id')
+
+
+def test_inactive_months_inside_the_span_count_as_zero_spend():
+    features = features_by_id(monthly_rows([
+        ("C1", "2024-01-01", 60.0, 2, 1),
+        ("C1", "2024-01-01", 40.0, 2, 0),  # a second merchant category in the same month
+        ("C1", "2024-03-01", 300.0, 4, 1),
+    ]))
+
+    spend = np.array([100.0, 0.0, 300.0])
+    assert features.loc["C1", "monthly_spend"] == round(spend.mean(), 2)
+    assert features.loc["C1", "spend_volatility"] == pytest.approx(spend.std() / spend.mean())
+    assert features.loc["C1", "international_ratio"] == pytest.approx(2 / 8)
+
+
+def test_spend_volatility_is_capped_and_single_months_are_steady():
+    features = features_by_id(monthly_rows([
+        ("C1", "2024-01-01", 1000.0, 1, 0),
+        ("C1", "2024-12-01", 1.0, 1, 0),
+        ("C2", "2024-05-01", 250.0, 5, 5),
+    ]))
+
+    assert features.loc["C1", "spend_volatility"] == 1.0
+    assert features.loc["C2", "monthly_spend"] == 250.0
+    assert features.loc["C2", "spend_volatility"] == 0.0
+    assert features.loc["C2", "international_ratio"] == 1.0
+
+
+def test_span_crosses_year_boundaries():
+    features = features_by_id(monthly_rows([
+        ("C1", "2023-12-01", 90.0, 3, 0),
+        ("C1", "2024-02-01", 90.0, 3, 0),
+    ]))
+
+    assert features.loc["C1", "monthly_spend"] == 60.0
+
+
+def test_zero_spend_has_no_volatility():
+    features = features_by_id(monthly_rows([("C1", "2024-01-01", 0.0, 0, 0)]))
+
+    assert features.loc["C1", "monthly_spend"] == 0.0
+    assert features.loc["C1", "spend_volatility"] == 0.0
+    assert features.loc["C1", "international_ratio"] == 0.0
+
+
+@pytest.mark.anyio
+async def test_derive_counts_only_existing_customers(mock_db):
+    await mock_db.customers.insert_one({"id": "C1", "monthly_spend": 0.0})
+    await mock_db.transaction_rollups.insert_many([
+        {"granularity": "month", "customer_id": customer_id, "merchant_category": "Travel",
+         "period": datetime(2024, 1, 1), "amount": 100.0, "count": 2, "international_count": 1}
+        for customer_id in ("C1", "GHOST")
+    ])
+
+    result = await server.derive_customer_features(["C1", "GHOST"], source=mock_db)
+
+    assert result["customers_derived"] == 1
+    assert (await mock_db.customers.find_one({"id": "C1"}))["monthly_spend"] == 100.0
+    assert await mock_db.customers.count_documents({"id": "GHOST"}) == 0
@@ -0,0 +1,65 @@
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client(mock_db):
+    with TestClient(server.app) as client:
+        yield client
+
+
+def test_not_modified_responses_are_timed_under_their_route(client):
+    etag = client.get("/api/dashboard/stats").headers["etag"]
+
+    response = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    metrics = client.get("/metrics").text
+    assert 'method="GET",route="/api/dashboard/stats",status="304"' in metrics
+
+
+def test_customer_export_streams_ndjson(client, mock_db):
+    client.portal.call(mock_db.customers.insert_many, [{"id": f"C{i}", "monthly_spend": 10.0 * i} for i in range(3)])
+
+    response = client.get("/api/customers", params={"stream": "true"})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [orjson.loads(line) for line in response.text.splitlines()] == [
+        {"id": f"C{i}", "monthly_spend": 10.0 * i} for i in range(3)
+    ]
+
+
+def test_recommendation_batch_lines_are_valid_json(client, mock_db):
+    client.portal.call(mock_db.customers.insert_many, [
+        {"id": "C1", "segment": "Travel-Heavy Corporates"},
+        {"id": "C2", "segment": None},
+    ])
+
+    response = client.post("/api/recommendations/batch", json={"customer_ids": ["C1", "C2", "C3"]})
+
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    assert [line["customer_id"] for line in lines] == ["C1", "C2", "C3"]
+    assert lines[0]["recommendations"] == server.SEGMENT_RECOMMENDATIONS["Travel-Heavy Corporates"]
+    assert lines[1]["recommendations"] == server.DEFAULT_RECOMMENDATIONS
+    assert lines[2] == {"customer_id": "C3", "error": "Customer not found"}
+
+
+def test_etag_changes_when_the_data_version_moves(client):
+    first = client.get("/api/dashboard/stats")
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    client.portal.call(server.update_dashboard_summary, {"total_customers": 5})
+    response = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["total_customers"] == 5
+
+
+def test_only_versioned_reads_are_tagged(client):
+    assert "etag" not in client.get("/api/").headers
+    assert "etag" not in client.post("/api/recommendations/batch", json={"customer_ids": ["C1"]}).headers
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.mark.anyio
+async def test_keyset_pages_cover_every_document_once(mock_db):
+    await mock_db.customers.insert_many([{"id": f"C{i}", "segment": "A" if i % 3 else "B"} for i in range(10)])
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        page = await server.paginate(mock_db.customers, {"segment": "A"}, 3, cursor)
+        seen += [doc["id"] for doc in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"C{i}" for i in range(10) if i % 3]
+    assert pages == 2
+    assert all("_id" not in doc for doc in page["items"])
+
+
+@pytest.mark.anyio
+async def test_a_full_last_page_has_no_next_cursor(mock_db):
+    await mock_db.customers.insert_many([{"id": f"C{i}"} for i in range(4)])
+
+    page = await server.paginate(mock_db.customers, {}, 4, None)
+
+    assert len(page["items"]) == 4
+    assert page["next_cursor"] is None
+
+
+def test_an_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as raised:
+        server.keyset_query({}, "not-an-object-id")
+
+    assert raised.value.status_code == 400
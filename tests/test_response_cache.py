@@ -0,0 +1,90 @@
+import pytest
+from pymongo.errors import PyMongoError
+
+import server
+
+
+class FailingBackend:
+    async def get(self, key):
+        raise PyMongoError("cache backend down")
+
+    async def set(self, key, value, ttl_seconds):
+        raise PyMongoError("cache backend down")
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_entries_are_evicted():
+    cache = server.ResponseCache(max_entries=2, ttl_seconds=60)
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    assert await cache.get("a") == 1
+
+    await cache.set("c", 3)
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.anyio
+async def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache = server.ResponseCache(max_entries=10, ttl_seconds=5)
+    await cache.set("a", 1)
+
+    now[0] += 6
+
+    assert await cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.anyio
+async def test_oversized_lists_are_not_cached():
+    cache = server.ResponseCache(max_entries=10, ttl_seconds=60, max_items=3)
+
+    await cache.set("long", [1, 2, 3, 4])
+    await cache.set("short", [1, 2, 3])
+
+    assert await cache.get("long") is None
+    assert await cache.get("short") == [1, 2, 3]
+    assert cache.stats()["oversized"] == 1
+
+
+@pytest.mark.anyio
+async def test_failing_backend_only_costs_the_shared_layer():
+    cache = server.ResponseCache(max_entries=10, ttl_seconds=60, backend=FailingBackend())
+
+    await cache.set("a", 1)
+
+    assert await cache.get("a") == 1
+    assert await cache.get("b") is None
+    assert cache.stats()["backend_errors"] == 2
+
+
+@pytest.mark.anyio
+async def test_shared_backend_serves_other_processes(mock_db):
+    writer = server.ResponseCache(max_entries=10, ttl_seconds=60, backend=server.MongoCacheBackend(mock_db.response_cache))
+    reader = server.ResponseCache(max_entries=10, ttl_seconds=60, backend=server.MongoCacheBackend(mock_db.response_cache))
+
+    await writer.set("a", {"total": 1})
+
+    assert await reader.get("a") == {"total": 1}
+    assert reader.stats()["shared_hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_a_stale_data_version_is_never_served(mock_db):
+    computed = []
+
+    async def compute():
+        computed.append(len(computed) + 1)
+        return {"value": computed[-1]}
+
+    first = await server.cached_response("stats", {}, compute)
+    assert await server.cached_response("stats", {}, compute) == first
+
+    await server.update_dashboard_summary({"total_customers": 1})
+
+    assert await server.cached_response("stats", {}, compute) == {"value": 2}
+    assert computed == [1, 2]
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import server
+
+BUCKET_COLUMNS = server.ROLLUP_KEY_COLUMNS + server.ROLLUP_VALUE_COLUMNS
+
+
+def transaction_frame(count=40):
+    return pd.DataFrame({
+        "customer_id": [f"C{i % 7}" for i in range(count)],
+        "merchant_category": [["Travel", "Dining", "Office"][i % 3] for i in range(count)],
+        "amount": [float(10 + i) for i in range(count)],
+        "is_international": [i % 4 == 0 for i in range(count)],
+        "transaction_date": [datetime(2024, 1 + i % 3, 1 + i % 28) for i in range(count)],
+    })
+
+
+def sorted_buckets(rollups):
+    frame = pd.DataFrame(rollups)[BUCKET_COLUMNS]
+    frame['period'] = pd.to_datetime(frame['period'])
+    return frame.sort_values(server.ROLLUP_KEY_COLUMNS).reset_index(drop=True)
+
+
+@pytest.mark.anyio
+async def test_rebuild_rollups_in_chunks_matches_one_shot_rollups(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "INGEST_CHUNK_SIZE", 4)
+    transactions = transaction_frame()
+    await mock_db.transactions.insert_many(transactions.to_dict('records'))
+
+    result = await server.rebuild_rollups()
+
+    expected = server.build_rollups(transactions)
+    stored = [doc async for doc in mock_db.transaction_rollups.find({}, {"_id": 0})]
+    assert result["rollups_written"] == len(expected)
+    pd.testing.assert_frame_equal(sorted_buckets(stored), sorted_buckets(expected), check_dtype=False)
+
+
+@pytest.mark.anyio
+async def test_appended_rollups_are_added_to_existing_buckets(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "INGEST_CHUNK_SIZE", 5)
+    transactions = transaction_frame()
+    first, second = transactions.iloc[:25], transactions.iloc[25:]
+
+    await server.write_rollups(server.build_rollups(first), reset=True)
+    await server.write_rollups(server.build_rollups(second))
+
+    stored = [doc async for doc in mock_db.transaction_rollups.find({}, {"_id": 0})]
+    pd.testing.assert_frame_equal(sorted_buckets(stored), sorted_buckets(server.build_rollups(transactions)), check_dtype=False)
+
+
+def test_build_rollups_sums_day_and_month_buckets():
+    transactions = pd.DataFrame({
+        "customer_id": ["C1", "C1", "C1"],
+        "merchant_category": ["Travel", "Travel", "Travel"],
+        "amount": [10.0, 20.0, 5.0],
+        "is_international": [True, False, True],
+        "transaction_date": [datetime(2024, 1, 3, 9), datetime(2024, 1, 3, 18), datetime(2024, 1, 20)],
+    })
+
+    rollups = sorted_buckets(server.build_rollups(transactions))
+
+    assert rollups.to_dict('records') == [
+        {"granularity": "day", "customer_id": "C1", "merchant_category": "Travel", "period": pd.Timestamp(2024, 1, 3),
+         "amount": 30.0, "count": 2, "international_count": 1},
+        {"granularity": "day", "customer_id": "C1", "merchant_category": "Travel", "period": pd.Timestamp(2024, 1, 20),
+         "amount": 5.0, "count": 1, "international_count": 1},
+        {"granularity": "month", "customer_id": "C1", "merchant_category": "Travel", "period": pd.Timestamp(2024, 1, 1),
+         "amount": 35.0, "count": 3, "international_count": 2},
+    ]
+
+
+def test_pre_aggregated_rows_roll_up_like_raw_transactions():
+    transactions = transaction_frame()
+    daily = server.build_rollups(transactions).query("granularity == 'day'").drop(columns='granularity')
+    daily = daily.rename(columns={"period": "transaction_date"})
+
+    pd.testing.assert_frame_equal(
+        sorted_buckets(server.build_rollups(daily)), sorted_buckets(server.build_rollups(transactions)), check_dtype=False
+    )
+
+
+def test_merged_chunk_rollups_match_one_shot_rollups():
+    transactions = transaction_frame()
+    chunks = [server.build_rollups(transactions.iloc[start:start + 6]) for start in range(0, len(transactions), 6)]
+
+    pd.testing.assert_frame_equal(
+        sorted_buckets(server.merge_rollups(chunks)), sorted_buckets(server.build_rollups(transactions)), check_dtype=False
+    )
+
+
+def test_upload_fold_matches_one_shot_rollups_and_totals():
+    transactions = transaction_frame()
+    raw = transactions.assign(merchant_name="Merchant", transaction_date=transactions['transaction_date'].astype(str))
+
+    delta = {}
+    rollups = None
+    for start in range(0, len(raw), 9):
+        _, rollups = server.prepare_transaction_chunk(raw.iloc[start:start + 9], delta, rollups)
+
+    pd.testing.assert_frame_equal(sorted_buckets(rollups), sorted_buckets(server.build_rollups(transactions)), check_dtype=False)
+    assert delta == server.summarize_transactions(transactions)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+
+
+def candidates(inertias, first_k=2):
+    return [{"k": first_k + i, "inertia": inertia} for i, inertia in enumerate(inertias)]
+
+
+def test_elbow_k_picks_the_bend():
+    assert server.elbow_k(candidates([100.0, 40.0, 30.0, 25.0, 22.0])) == 3
+    assert server.elbow_k(candidates([100.0, 90.0, 80.0, 20.0, 15.0, 12.0])) == 5
+
+
+def test_elbow_k_falls_back_to_the_smallest_k():
+    assert server.elbow_k(candidates([100.0, 40.0])) == 2
+    assert server.elbow_k(candidates([50.0, 50.0, 50.0], first_k=3)) == 3
+
+
+def segment_frame(clusters):
+    """Build feature rows and labels from (label, feature row, repeat count) tuples"""
+    rows, labels = [], []
+    for label, row, repeat in clusters:
+        rows.extend([row] * repeat)
+        labels.extend([label] * repeat)
+    return pd.DataFrame(rows, columns=server.SEGMENT_FEATURES), np.array(labels)
+
+
+def test_name_segments_applies_the_business_heuristics():
+    features, labels = segment_frame([
+        (0, [20000.0, 0.2, 0.1, 0.9], 2),
+        (1, [5000.0, 0.2, 0.6, 0.9], 2),
+        (2, [5000.0, 0.2, 0.1, 0.4], 2),
+        (3, [5000.0, 0.2, 0.1, 0.9], 4),
+    ])
+
+    assert server.name_segments(features, labels, 4) == {
+        0: "High-Growth Corporates",
+        1: "Travel-Heavy Corporates",
+        2: "Low-Engagement / At-Risk",
+        3: "Stable Mature Accounts",
+    }
+
+
+def test_name_segments_keeps_names_unique():
+    features, labels = segment_frame([(seg_id, [5000.0, 0.2, 0.1, 0.9], 1) for seg_id in range(6)])
+
+    names = server.name_segments(features, labels, 6)
+
+    assert len(set(names.values())) == 6
+    assert set(server.SEGMENT_NAMES.values()) <= set(names.values())
+    assert names[4] == "Stable Mature Accounts 2"
+    assert names[5] == "Stable Mature Accounts 3"
+
+
+def test_predict_segments_uses_the_scaled_centroids():
+    model = {"scaler_mean": [10.0, 0.5], "scaler_scale": [10.0, 0.5], "centroids": [[-1.0, -1.0], [1.0, 1.0]]}
+    # Unscaled, the last row is nearer [0, 0]; scaled, it is nearer the second centroid
+    X = np.array([[0.0, 0.0], [20.0, 1.0], [9.0, 0.95]])
+
+    labels = server.predict_segments(model, X)
+
+    assert labels.dtype == np.int32
+    assert labels.tolist() == [0, 1, 1]
+
+
+def test_predict_segments_reproduces_the_fitted_labels():
+    rng = np.random.default_rng(0)
+    centers = np.array([[20000.0, 0.2, 0.1, 0.9], [5000.0, 0.6, 0.7, 0.9], [3000.0, 0.3, 0.1, 0.3]])
+    X = np.vstack([center + rng.normal(0, [500.0, 0.02, 0.02, 0.02], size=(30, 4)) for center in centers])
+
+    labels, model = server.fit_segments(X, n_clusters=3)
+
+    assert np.array_equal(server.predict_segments(model, X), labels)
+
+
+@pytest.mark.anyio
+async def test_model_versions_are_allocated_before_the_model_is_stored(mock_db):
+    # Saved before versions came from the summary counter
+    await mock_db.segment_models.insert_one({"version": 3})
+
+    # Two segmentations finishing together both allocate before either model is inserted
+    first = await server.next_segment_model_version()
+    second = await server.next_segment_model_version()
+    saved = await server.save_segment_model({"n_clusters": 4}, 10)
+
+    assert (first, second, saved["version"]) == (4, 5, 6)
+    assert (await server.get_active_segment_model())["version"] == 6
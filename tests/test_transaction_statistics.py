@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+import server
+
+
+def make_transactions(rows):
+    return pd.DataFrame(rows, columns=['customer_id', 'merchant_category', 'amount'])
+
+
+def test_merge_transaction_totals_matches_a_single_summary():
+    first = make_transactions([("C1", "Travel", 100.0), ("C1", "Dining", 20.0), ("C2", "Travel", 50.0)])
+    second = make_transactions([("C1", "Travel", 30.0), ("C3", "Office", 10.0)])
+
+    totals = server.summarize_transactions(first)
+    server.merge_transaction_totals(totals, server.summarize_transactions(second))
+
+    assert totals == server.summarize_transactions(pd.concat([first, second]))
+    assert totals["C1"] == {"total_transaction_amount": 150.0, "merchant_category_counts": {"Travel": 2, "Dining": 1}}
+    assert totals["C3"] == {"total_transaction_amount": 10.0, "merchant_category_counts": {"Office": 1}}
+
+
+def test_merge_transaction_totals_into_empty_totals():
+    delta = server.summarize_transactions(make_transactions([("C1", "Travel", 12.5)]))
+
+    totals = {}
+    server.merge_transaction_totals(totals, delta)
+
+    assert totals == delta
+
+
+@pytest.mark.anyio
+async def test_update_customer_statistics_appends_to_stored_counters(mock_db):
+    await mock_db.customers.insert_many([
+        {"id": "C1", "total_transactions": 3, "total_transaction_amount": 300.0,
+         "merchant_category_counts": {"Dining": 2, "Travel": 1}},
+        {"id": "C2"},
+    ])
+    delta = server.summarize_transactions(make_transactions([
+        ("C1", "Travel", 100.0), ("C1", "Travel", 100.0), ("C2", "Office", 40.0), ("GHOST", "Travel", 5.0)
+    ]))
+
+    updated = await server.update_customer_statistics(delta)
+
+    assert updated == 2
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 5
+    assert c1["total_transaction_amount"] == 500.0
+    assert c1["avg_transaction_value"] == 100.0
+    assert c1["merchant_category_counts"] == {"Dining": 2, "Travel": 3}
+    assert c1["top_merchant_category"] == "Travel"
+    c2 = await mock_db.customers.find_one({"id": "C2"}, {"_id": 0})
+    assert c2["total_transactions"] == 1
+    assert c2["top_merchant_category"] == "Office"
+    assert await mock_db.customers.count_documents({"id": "GHOST"}) == 0
+
+
+@pytest.mark.anyio
+async def test_update_customer_statistics_recomputes_legacy_customers(mock_db):
+    # Stored before running counters existed: only the derived statistics are present
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 1, "avg_transaction_value": 80.0})
+    await mock_db.transactions.insert_many([
+        {"customer_id": "C1", "merchant_category": "Dining", "amount": 80.0},
+        {"customer_id": "C1", "merchant_category": "Travel", "amount": 20.0},
+    ])
+    # The new Travel transaction is already stored, so it must not be counted twice
+    delta = server.summarize_transactions(make_transactions([("C1", "Travel", 20.0)]))
+
+    await server.update_customer_statistics(delta)
+
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 2
+    assert c1["total_transaction_amount"] == 100.0
+    assert c1["merchant_category_counts"] == {"Dining": 1, "Travel": 1}
+
+
+@pytest.mark.anyio
+async def test_derived_statistics_skip_customers_appended_to_since_they_were_read(mock_db):
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 2, "total_transaction_amount": 20.0,
+                                        "merchant_category_counts": {"Travel": 2}})
+    read = await mock_db.customers.find({}, {"_id": 0}).to_list(None)
+    # A concurrent append lands between the read and the derived update
+    await mock_db.customers.bulk_write(server.transaction_increments(
+        server.summarize_transactions(make_transactions([("C1", "Dining", 100.0), ("C1", "Dining", 100.0), ("C1", "Dining", 100.0)]))
+    ))
+
+    result = await mock_db.customers.bulk_write(server.derived_statistics_updates(read))
+
+    assert result.matched_count == 0
+
+
+@pytest.mark.anyio
+async def test_categories_that_are_not_field_paths_are_recomputed(mock_db):
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 0, "total_transaction_amount": 0.0,
+                                        "merchant_category_counts": {}})
+    await mock_db.transactions.insert_one({"customer_id": "C1", "merchant_category": "Dining.Cafes", "amount": 12.0})
+
+    await server.update_customer_statistics(server.summarize_transactions(make_transactions([("C1", "Dining.Cafes", 12.0)])))
+
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 1
+    assert c1["top_merchant_category"] == "Dining.Cafes"
@@ -0,0 +1,113 @@
+import io
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+import server
+
+HEADER = "customer_id,amount,merchant_category,is_international,transaction_date,merchant_name\n"
+
+
+def csv_upload(*rows):
+    return UploadFile(io.BytesIO((HEADER + "".join(f"{row}\n" for row in rows)).encode()), filename="transactions.csv")
+
+
+@pytest.mark.anyio
+async def test_header_only_replace_clears_transactions(mock_db):
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 2, "total_transaction_amount": 50.0,
+                                        "merchant_category_counts": {"Travel": 2}})
+    await mock_db.transactions.insert_one({"customer_id": "C1", "merchant_category": "Travel", "amount": 50.0})
+    await mock_db.transaction_rollups.insert_one({"granularity": "day", "customer_id": "C1"})
+
+    result = await server.upload_transactions(csv_upload(), mode="replace")
+
+    assert result["transactions_created"] == 0
+    assert await mock_db.transactions.count_documents({}) == 0
+    assert await mock_db.transaction_rollups.count_documents({}) == 0
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 0
+    assert c1["merchant_category_counts"] == {}
+
+
+@pytest.mark.anyio
+async def test_header_only_append_is_a_no_op(mock_db):
+    result = await server.upload_transactions(csv_upload(), mode="append")
+
+    assert result["transactions_created"] == 0
+    assert await mock_db.transactions.count_documents({}) == 0
+
+
+@pytest.mark.anyio
+async def test_failed_append_commits_nothing(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "INGEST_CHUNK_SIZE", 2)
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 1, "total_transaction_amount": 10.0,
+                                        "merchant_category_counts": {"Travel": 1}})
+    await mock_db.transactions.insert_one({"id": "T0", "customer_id": "C1", "merchant_category": "Travel", "amount": 10.0})
+    rows = [f"C1,{amount},Travel,false,2024-01-0{day},Air" for day, amount in enumerate(["5", "5", "5", "5", "oops"], 1)]
+
+    with pytest.raises(HTTPException) as raised:
+        await server.upload_transactions(csv_upload(*rows), mode="append")
+
+    assert raised.value.status_code == 400
+    assert [t["id"] async for t in mock_db.transactions.find({})] == ["T0"]
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 1
+    assert c1["total_transaction_amount"] == 10.0
+
+
+@pytest.mark.anyio
+async def test_failed_replace_keeps_the_live_transactions(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "INGEST_CHUNK_SIZE", 2)
+    await mock_db.transactions.insert_one({"id": "T0", "customer_id": "C1", "merchant_category": "Travel", "amount": 10.0})
+    rows = ["C1,5,Travel,false,2024-01-01,Air", "C1,5,Travel,false,2024-01-02,Air", "C1,oops,Travel,false,2024-01-03,Air"]
+
+    with pytest.raises(HTTPException) as raised:
+        await server.upload_transactions(csv_upload(*rows), mode="replace")
+
+    assert raised.value.status_code == 400
+    assert [t["id"] async for t in mock_db.transactions.find({})] == ["T0"]
+    assert "transactions_staging" not in await mock_db.list_collection_names()
+
+
+@pytest.mark.anyio
+async def test_append_failing_after_statistics_rolls_them_back(mock_db, monkeypatch):
+    write_rollups = server.write_rollups
+
+    async def failing_write_rollups(rollups, reset=False):
+        # Only the upload's own write fails; the rebuild after it goes through
+        monkeypatch.setattr(server, "write_rollups", write_rollups)
+        raise RuntimeError("rollup write failed")
+
+    monkeypatch.setattr(server, "write_rollups", failing_write_rollups)
+    await mock_db.customers.insert_one({"id": "C1", "total_transactions": 1, "total_transaction_amount": 10.0,
+                                        "merchant_category_counts": {"Travel": 1}})
+    await mock_db.transactions.insert_one({"id": "T0", "customer_id": "C1", "merchant_category": "Travel", "amount": 10.0,
+                                           "is_international": False, "transaction_date": datetime(2024, 1, 1)})
+
+    with pytest.raises(HTTPException):
+        await server.upload_transactions(csv_upload("C1,5,Dining,false,2024-01-02,Cafe"), mode="append")
+
+    assert await mock_db.transactions.count_documents({}) == 1
+    c1 = await mock_db.customers.find_one({"id": "C1"}, {"_id": 0})
+    assert c1["total_transactions"] == 1
+    assert c1["merchant_category_counts"] == {"Travel": 1}
+    assert await mock_db.transaction_rollups.count_documents({"granularity": "day"}) == 1
+
+
+@pytest.mark.anyio
+async def test_failed_rebuild_keeps_the_upload_error(mock_db, monkeypatch):
+    async def failing_write_rollups(rollups, reset=False):
+        raise RuntimeError("rollup write failed")
+
+    monkeypatch.setattr(server, "write_rollups", failing_write_rollups)
+    # Written before dates were stored natively, so the rollup rebuild cannot group it by day
+    await mock_db.transactions.insert_one({"id": "T0", "customer_id": "C1", "merchant_category": "Travel", "amount": 10.0,
+                                           "is_international": False, "transaction_date": "2024-01-01T00:00:00"})
+
+    with pytest.raises(HTTPException) as raised:
+        await server.upload_transactions(csv_upload("C1,5,Travel,false,2024-01-02,Air"), mode="append")
+
+    assert raised.value.status_code == 400
+    assert raised.value.detail == "Error processing file: rollup write failed"